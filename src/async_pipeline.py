@@ -0,0 +1,131 @@
+"""
+Async Ingestion Pipeline module
+
+- Splits stream ingestion into fetch -> parse -> route -> persist stages running on one asyncio loop
+- Stages are joined by bounded queues, so a slow stage applies backpressure instead of growing memory
+- Each sink drains its queue in batches and writes them off the loop thread, so the network reader keeps going
+
+"""
+
+import asyncio
+import httpx
+
+from router_logger import route_record
+from serialization import loads
+
+_DONE = object()
+
+
+class IngestPipeline:
+    def __init__(self, plan, sqlStore, mongoStore, log,
+                 queue_size=2000, sink_batch_size=500, sink_flush_interval=1.0):
+        self.plan = plan
+        self.sqlStore = sqlStore
+        self.mongoStore = mongoStore
+        self.log = log
+        self.queue_size = queue_size
+        self.sink_batch_size = sink_batch_size
+        self.sink_flush_interval = sink_flush_interval
+        self.stats = {
+            "fetched": 0,
+            "routed": 0,
+            "sql_docs": 0,
+            "mongo_docs": 0,
+            "sql_batches": 0,
+            "mongo_batches": 0
+        }
+
+    async def _fetch(self, url, limit, line_queue):
+        try:
+            async with httpx.AsyncClient(timeout=None) as client:
+                async with client.stream("GET", url) as response:
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data: "):
+                            continue
+                        await line_queue.put(line[6:])
+                        self.stats["fetched"] += 1
+                        if self.stats["fetched"] >= limit:
+                            break
+        except httpx.HTTPError as e:
+            # Let the downstream stages drain what was already fetched
+            print(f"Stream error after {self.stats['fetched']} records: {e}")
+        finally:
+            await line_queue.put(_DONE)
+
+    async def _parse(self, line_queue, record_queue):
+        while True:
+            payload = await line_queue.get()
+            if payload is _DONE:
+                await record_queue.put(_DONE)
+                return
+            await record_queue.put(loads(payload))
+
+    async def _route(self, record_queue, sql_queue, mongo_queue):
+        while True:
+            record = await record_queue.get()
+            if record is _DONE:
+                self.plan.drift.flush()
+                await sql_queue.put(_DONE)
+                await mongo_queue.put(_DONE)
+                return
+
+            sDoc, mDoc = route_record(self.plan.normalize(record), self.plan, self.log)
+            self.stats["routed"] += 1
+            # Batch boundary: persist any buffered drift decisions in one write
+            if self.stats["routed"] % self.sink_batch_size == 0 and self.plan.drift.pending:
+                self.plan.drift.flush()
+            if sDoc: await sql_queue.put(sDoc)
+            if mDoc: await mongo_queue.put(mDoc)
+
+    async def _persist(self, queue, store, name):
+        batch = []
+        done = False
+        while not done:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=self.sink_flush_interval)
+            except asyncio.TimeoutError:
+                item = None
+
+            if item is _DONE:
+                done = True
+            elif item is not None:
+                batch.append(item)
+                # Drain whatever is already queued without yielding back to the loop per item
+                while len(batch) < self.sink_batch_size and not queue.empty():
+                    item = queue.get_nowait()
+                    if item is _DONE:
+                        done = True
+                        break
+                    batch.append(item)
+
+            if batch and (done or item is None or len(batch) >= self.sink_batch_size):
+                await asyncio.to_thread(store.append, batch)
+                self.stats[f"{name}_docs"] += len(batch)
+                self.stats[f"{name}_batches"] += 1
+                batch = []
+
+    async def run(self, url, limit):
+        line_queue = asyncio.Queue(maxsize=self.queue_size)
+        record_queue = asyncio.Queue(maxsize=self.queue_size)
+        sql_queue = asyncio.Queue(maxsize=self.queue_size)
+        mongo_queue = asyncio.Queue(maxsize=self.queue_size)
+
+        tasks = [
+            asyncio.create_task(self._fetch(url, limit, line_queue)),
+            asyncio.create_task(self._parse(line_queue, record_queue)),
+            asyncio.create_task(self._route(record_queue, sql_queue, mongo_queue)),
+            asyncio.create_task(self._persist(sql_queue, self.sqlStore, "sql")),
+            asyncio.create_task(self._persist(mongo_queue, self.mongoStore, "mongo")),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return self.stats
+
+
+def run_ingest_pipeline(url, limit, plan, sqlStore, mongoStore, log, **options):
+    pipeline = IngestPipeline(plan, sqlStore, mongoStore, log, **options)
+    return asyncio.run(pipeline.run(url, limit))
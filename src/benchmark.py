@@ -0,0 +1,399 @@
+"""
+Benchmark module
+
+- Micro-benchmarks for the hot paths of the pipeline, run on synthetic records
+- Records mimic the shape of external/simulation_code.py without needing faker or the server
+- Usage: python src/benchmark.py <name> [records]
+
+"""
+
+import io
+import sys
+import time
+import random
+import string
+
+
+def make_records(count, seed=42):
+    """Synthetic generator records: flat fields with per-field appearance rates plus a sparse nested block."""
+    rng = random.Random(seed)
+    letters = string.ascii_lowercase
+
+    def word(n=8):
+        return "".join(rng.choice(letters) for _ in range(n))
+
+    field_pool = {
+        "name": lambda: word(12),
+        "age": lambda: rng.randint(18, 70),
+        "email": lambda: f"{word(6)}@{word(5)}.com",
+        "ip_address": lambda: ".".join(str(rng.randint(0, 255)) for _ in range(4)),
+        "device_model": lambda: rng.choice(["iPhone 14", "Pixel 8", "Samsung S23", "OnePlus 12"]),
+        "os": lambda: rng.choice(["Android", "iOS", "Windows", "Linux", "MacOS"]),
+        "app_version": lambda: f"v{rng.randint(1, 5)}.{rng.randint(0, 9)}.{rng.randint(0, 9)}",
+        "battery": lambda: rng.randint(1, 100),
+        "charging": lambda: rng.choice([True, False]),
+        "gps_lat": lambda: rng.uniform(-90, 90),
+        "gps_lon": lambda: rng.uniform(-180, 180),
+        "altitude": lambda: round(rng.uniform(1, 3000), 2),
+        "city": lambda: word(7),
+        "postal_code": lambda: str(rng.randint(10000, 99999)),
+        "timestamp": lambda: f"2026-02-{rng.randint(10, 28)}T{rng.randint(10, 23)}:{rng.randint(10, 59)}:{rng.randint(10, 59)}.{rng.randint(100000, 999999)}",
+        "steps": lambda: rng.randint(0, 12000),
+        "heart_rate": lambda: rng.randint(60, 180),
+        "mood": lambda: rng.choice(["happy", "sad", "neutral", "angry", "excited"]),
+        "temperature_c": lambda: round(rng.uniform(-10, 45), 1),
+        "purchase_value": lambda: round(rng.uniform(5, 500), 2),
+        "item": lambda: rng.choice(["book", "phone", "shoes", "bag", "laptop", None]),
+        "subscription": lambda: rng.choice(["free", "trial", "basic", "premium"]),
+        "error_code": lambda: rng.choice([None, 100, 200, 500, 404, 403]),
+        "is_active": lambda: rng.choice([True, False]),
+        "comment": lambda: " ".join(word(rng.randint(3, 8)) for _ in range(6)),
+        "friends_count": lambda: rng.randint(0, 5000),
+    }
+    weights = {key: rng.uniform(0.05, 0.95) for key in field_pool}
+    users = [word(10) for _ in range(1000)]
+
+    records = []
+    for i in range(count):
+        record = {"username": rng.choice(users)}
+        for key, weight in weights.items():
+            if rng.random() < weight:
+                record[key] = field_pool[key]()
+        if rng.random() > 0.4:
+            meta = {
+                "sensor_data": {"version": "2.1", "calibrated": rng.choice([True, False]),
+                                "readings": [rng.randint(1, 10) for _ in range(3)]},
+                "tags": [word(5) for _ in range(rng.randint(1, 3))],
+                "is_bot": rng.choice([True, False]),
+            }
+            record["metadata"] = {k: v for k, v in meta.items() if rng.random() > 0.5}
+        record["sys_ingested_time"] = f"2026-02-15T17:40:{i % 60:02d}.{i:06d}"
+        records.append(record)
+    return records
+
+
+def _timed(label, fn, count):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed:8.3f}s  {elapsed / count * 1e6:8.2f} us/record")
+    return elapsed
+
+
+# --- Routing ---
+
+def _legacy_route_record(record, schemaMap, analyzedSchema, logFile):
+    """The pre-compilation route_record: per-value map lookups, isinstance chain and string compares."""
+    from router_logger import getValType
+
+    ingestTime = record['sys_ingested_time']
+    sqlDoc = {}
+    mongoDoc = {}
+    logEntry = f"Record received at {ingestTime}\n"
+    logEntry += f"{len(record)} Fields\n"
+
+    for field, value in record.items():
+        existing_decision = schemaMap.get(field, "MONGO")
+        expectedType = analyzedSchema.get(field)
+        currentType = getValType(value)
+        if expectedType and currentType != expectedType and existing_decision != "MONGO":
+            schemaMap[field] = "MONGO"
+            decision = "MONGO"
+        else:
+            decision = existing_decision
+
+        logEntry += f"{field} : {decision}\n"
+        if decision == "SQL":
+            sqlDoc[field] = value
+        elif decision == "MONGO":
+            mongoDoc[field] = value
+        elif decision == "BOTH":
+            sqlDoc[field] = value
+            mongoDoc[field] = value
+
+    logEntry += "\n"
+    logFile.write(logEntry)
+    return sqlDoc, mongoDoc
+
+
+def _routing_schema(records):
+    """Builds a drift-free schema for the synthetic records (every value matches its dominant type)."""
+    from router_logger import getValType
+
+    types = {}
+    for record in records:
+        for field, value in record.items():
+            types.setdefault(field, set()).add(getValType(value))
+
+    schemaMap = {}
+    analyzedSchema = {}
+    for i, (field, seen) in enumerate(sorted(types.items())):
+        if field in ("username", "timestamp", "sys_ingested_time"):
+            schemaMap[field] = "BOTH"
+        elif len(seen) > 1:
+            schemaMap[field] = "MONGO"
+        else:
+            schemaMap[field] = "SQL" if i % 3 else "MONGO"
+        analyzedSchema[field] = next(iter(seen))
+
+    # Leave one field unknown so the slow path is exercised too
+    schemaMap.pop("comment", None)
+    return schemaMap, analyzedSchema
+
+
+def bench_routing(count=50000):
+    from router_logger import RoutingPlan, route_record
+    from log_sink import RouterLog
+
+    records = make_records(count)
+    schemaMap, analyzedSchema = _routing_schema(records)
+    plan = RoutingPlan(dict(schemaMap), analyzedSchema)
+
+    print(f"Routing {count} records ({len(schemaMap)} known fields)")
+    # The legacy loop builds its text log inline, so its figure includes that cost;
+    # the structured log is measured separately by bench_logging.
+    legacy = _timed("legacy per-value branching", lambda: [
+        _legacy_route_record(r, schemaMap, analyzedSchema, io.StringIO()) for r in records], count)
+    log = RouterLog(level="off")
+    compiled = _timed("compiled routing plan", lambda: [
+        route_record(r, plan, log) for r in records], count)
+    print(f"speedup: {legacy / compiled:.2f}x")
+
+
+def bench_logging(count=50000):
+    """Routing cost at each router log verbosity, plus the old text log for reference."""
+    import tempfile
+    from router_logger import RoutingPlan, route_record
+    from log_sink import RouterLog
+
+    records = make_records(count)
+    schemaMap, analyzedSchema = _routing_schema(records)
+    tmpDir = tempfile.mkdtemp()
+
+    print(f"Routing {count} records to a log file at each verbosity")
+    with open(f"{tmpDir}/legacy.txt", 'a', encoding='utf-8') as logFile:
+        legacyMap = dict(schemaMap)
+        _timed("legacy text log", lambda: [
+            _legacy_route_record(r, legacyMap, analyzedSchema, logFile) for r in records], count)
+
+    for level in ("field", "record", "batch", "off"):
+        plan = RoutingPlan(dict(schemaMap), analyzedSchema)
+        with RouterLog(f"{tmpDir}/router_{level}.jsonl", level=level) as log:
+            _timed(f"structured log, level={level}", lambda: [
+                route_record(r, plan, log) for r in records], count)
+
+
+# --- Normalization ---
+
+def bench_normalizer(count=100000):
+    """Fuzzy key resolution with the raw-key cache disabled, cold, warm-started, and with the path cache."""
+    import tempfile
+    from normalizer import DynamicNormalizer
+
+    records = make_records(count)
+    cache_path = f"{tempfile.mkdtemp()}/normalizer_cache.json"
+
+    print(f"Normalizing {count} records")
+    uncached = DynamicNormalizer(cache_size=0, path_cache_size=0)
+    baseline = _timed("no key cache", lambda: [uncached.normalize_record(r) for r in records], count)
+
+    cold = DynamicNormalizer(path_cache_size=0)
+    cached = _timed("LRU key cache (cold)", lambda: [cold.normalize_record(r) for r in records], count)
+    cold.save_cache(cache_path)
+
+    warm = DynamicNormalizer(path_cache_size=0)
+    warm.load_cache(cache_path)
+    _timed("LRU key cache (warm start)", lambda: [warm.normalize_record(r) for r in records], count)
+
+    # What the router uses on the live path: warm start plus the (parent path, raw key) cache
+    live = DynamicNormalizer()
+    live.load_cache(cache_path)
+    _timed("key + path cache (warm start)", lambda: [live.normalize_record(r) for r in records], count)
+
+    print(f"fuzzy lookups: {uncached.cache_misses} uncached vs {cold.cache_misses} cold vs {warm.cache_misses} warm")
+    print(f"speedup: {baseline / cached:.2f}x")
+
+
+def bench_key_index(vocabulary=5000, lookups=2000):
+    """Linear get_close_matches scan vs the KeyIndex candidate filter on a large nested-path vocabulary."""
+    from difflib import get_close_matches
+    from normalizer import KeyIndex
+
+    rng = random.Random(7)
+    alphabet = string.ascii_lowercase + "_"
+    parts = ["".join(rng.choice(alphabet) for _ in range(rng.randint(3, 10))) for _ in range(400)]
+    vocab = set()
+    while len(vocab) < vocabulary:
+        vocab.add(".".join(rng.choice(parts) for _ in range(rng.randint(1, 4))))
+    vocab = sorted(vocab)
+
+    index = KeyIndex(0.85)
+    for key in vocab:
+        index.add(key)
+
+    # Misspell known keys with a few random edits
+    queries = []
+    for _ in range(lookups):
+        chars = list(rng.choice(vocab))
+        for _ in range(rng.randint(0, 3)):
+            pos = rng.randrange(len(chars))
+            chars[pos] = rng.choice(alphabet)
+        queries.append("".join(chars))
+
+    print(f"{lookups} fuzzy lookups against {len(vocab)} master keys")
+    linear = []
+    indexed = []
+    baseline = _timed("linear scan", lambda: linear.extend(
+        get_close_matches(q, vocab, n=1, cutoff=0.85) for q in queries), lookups)
+    filtered = _timed("bigram/length index", lambda: indexed.extend(
+        get_close_matches(q, index.candidates(q), n=1, cutoff=0.85) for q in queries), lookups)
+    print(f"identical matches: {linear == indexed}, speedup: {baseline / filtered:.2f}x")
+
+
+# --- Analysis ---
+
+def bench_analyzer(count=1000000):
+    """Row-by-row DataAnalyzer vs the pandas columnar path, checking both summaries are identical."""
+    import os
+    import tempfile
+    from analyzer import DataAnalyzer
+    from normalizer import DynamicNormalizer
+
+    normalizer = DynamicNormalizer()
+    records = [normalizer.normalize_record(r) for r in make_records(count)]
+    out_dir = tempfile.mkdtemp()
+
+    print(f"Analyzing {count} normalized records")
+    row = DataAnalyzer()
+    baseline = _timed("row-by-row", lambda: row.analyze_records(records), count)
+    columnar = DataAnalyzer()
+    vectorized = _timed("columnar (pandas)", lambda: columnar.analyze_records_columnar(records), count)
+
+    same = (row.save_analysis(os.path.join(out_dir, "row.json"))
+            == columnar.save_analysis(os.path.join(out_dir, "columnar.json")))
+    print(f"identical summaries: {same}, speedup: {baseline / vectorized:.2f}x")
+
+
+def bench_sharded(count=1000000, workers=None):
+    """Single-process analysis vs the sharded process-pool map/reduce, checking both summaries are identical."""
+    import os
+    import tempfile
+    from analyzer import DataAnalyzer, analyze_sharded
+    from normalizer import DynamicNormalizer
+
+    workers = workers or os.cpu_count() or 2
+    normalizer = DynamicNormalizer()
+    records = [normalizer.normalize_record(r) for r in make_records(count)]
+    out_dir = tempfile.mkdtemp()
+
+    print(f"Analyzing {count} normalized records with {workers} workers")
+    single = DataAnalyzer()
+    baseline = _timed("single process", lambda: single.analyze_records(records), count)
+    sharded = DataAnalyzer()
+    parallel = _timed("sharded map/reduce", lambda: analyze_sharded(sharded, records, workers), count)
+
+    same = (single.save_analysis(os.path.join(out_dir, "single.json"))
+            == sharded.save_analysis(os.path.join(out_dir, "sharded.json")))
+    print(f"identical summaries: {same}, speedup: {baseline / parallel:.2f}x")
+
+
+# --- Classification ---
+
+def bench_classifier(count=50000):
+    """Per-field classifyField vs classifyBulk on a wide synthetic schema, checking the results are identical."""
+    from classifier import FieldStats, SchemaClassifier, WEIGHTS, THRESHOLDS, MONGO_SCORE_THRESHOLD, MANDATORY_BOTH
+
+    rng = random.Random(3)
+    types = ["string", "integer", "float", "boolean", "object", "array", "pattern_d.d.d.d"]
+    names = list(MANDATORY_BOTH) + [f"path_{i}.leaf" for i in range(count - len(MANDATORY_BOTH))]
+    stats = [FieldStats(
+        fieldName=name,
+        frequency=rng.choice([rng.random(), 0.6, 1.0]),
+        dominantType=rng.choice(types),
+        typeStability=rng.choice([1.0, 0.9999, rng.random()]),
+        cardinality=rng.choice([rng.random(), 0.1]),
+        isNested="." in name and rng.random() < 0.5,
+        isArray=rng.random() < 0.1,
+    ) for name in names]
+    columns = {key: [getattr(field, key) for field in stats] for key in FieldStats.__dataclass_fields__}
+
+    classifier = SchemaClassifier(WEIGHTS, THRESHOLDS, MONGO_SCORE_THRESHOLD)
+    perField = []
+    bulk = []
+    print(f"Classifying {count} fields")
+    baseline = _timed("classifyField per field", lambda: perField.extend(
+        classifier.classifyField(field) for field in stats), count)
+    vectorized = _timed("classifyBulk", lambda: bulk.extend(classifier.classifyBulk(columns)), count)
+    print(f"identical results: {perField == bulk}, speedup: {baseline / vectorized:.2f}x")
+
+
+# --- Serialization ---
+
+def bench_serialization(count=50000):
+    """Writes and reads normalized records as pretty stdlib JSON (the old format) and in each serialization format."""
+    import os
+    import json
+    import tempfile
+    import serialization
+    from normalizer import DynamicNormalizer
+
+    normalizer = DynamicNormalizer()
+    records = [normalizer.normalize_record(r) for r in make_records(count)]
+    directory = tempfile.mkdtemp()
+
+    def pretty_write(path):
+        with open(path, 'w') as f:
+            json.dump(records, f, indent=4)
+
+    def pretty_read(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def stdlib_write(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, separators=(',', ':'), ensure_ascii=False)
+
+    formats = [
+        ("json indent=4 (before)", "pretty.json", pretty_write, pretty_read),
+        ("json compact, stdlib", "stdlib.json", stdlib_write, pretty_read),
+        (f"json compact, {serialization.CODEC}", "records.json",
+         lambda path: serialization.write_records(records, path), serialization.read_records),
+        (f"ndjson, {serialization.CODEC}", "records.ndjson",
+         lambda path: serialization.write_records(records, path), serialization.read_records),
+        ("parquet (zstd)", "records.parquet",
+         lambda path: serialization.write_records(records, path), serialization.read_records),
+    ]
+
+    print(f"Serializing {count} normalized records")
+    for label, name, write, read in formats:
+        path = os.path.join(directory, name)
+        try:
+            _timed(f"{label} write", lambda: write(path), count)
+        except ImportError as e:
+            print(f"{label}: skipped ({str(e).splitlines()[0]})")
+            continue
+        loaded = []
+        _timed(f"{label} read", lambda: loaded.extend(read(path)), count)
+        print(f"{'':<32} {os.path.getsize(path) / 1024 / 1024:8.2f} MB  round trip ok: {loaded == records}")
+
+
+BENCHMARKS = {
+    "routing": bench_routing,
+    "logging": bench_logging,
+    "normalizer": bench_normalizer,
+    "key_index": bench_key_index,
+    "analyzer": bench_analyzer,
+    "sharded": bench_sharded,
+    "classifier": bench_classifier,
+    "serialization": bench_serialization,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"Usage: python src/benchmark.py <{'|'.join(BENCHMARKS)}> [records]")
+        sys.exit(1)
+
+    if len(sys.argv) > 2:
+        BENCHMARKS[sys.argv[1]](int(sys.argv[2]))
+    else:
+        BENCHMARKS[sys.argv[1]]()
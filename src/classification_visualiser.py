@@ -1,12 +1,11 @@
-import json
+from serialization import load
 import matplotlib.pyplot as plt
 import pandas as pd
 import seaborn as sns
 
 def plot_decision_boundary(json_path):
     # Load Data
-    with open(json_path, 'r') as f:
-        data = json.load(f)
+    data = load(json_path)
     
     df = pd.DataFrame(data)
     df = df.sort_values(by="score").reset_index(drop=True)
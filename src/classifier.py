@@ -1,6 +1,7 @@
-import json
+import numpy as np
 from dataclasses import dataclass
 from typing import List, Dict, Any
+from serialization import load, dump
 
 WEIGHTS = {
     "sparsity": 1.5,
@@ -17,6 +18,12 @@ THRESHOLDS = {
 MONGO_SCORE_THRESHOLD = 0.3 
 MANDATORY_BOTH = {"username", "timestamp", "sys_ingested_time"}
 
+# Storage cost model, in bytes (classifier mode "cost")
+COST_MODEL = {
+    "sqlColumnBytes": 1.0,    # every row pays for every SQL column, present or not (record header / null slot)
+    "docFieldOverhead": 2.0,  # type byte + key terminator stored with each document value, on top of the key name
+}
+
 @dataclass
 class FieldStats:
     fieldName: str
@@ -95,42 +102,184 @@ class SchemaClassifier:
 
         return result
 
-def runPipeline():
+    def _outcomeTable(self):
+        """
+        Every possible classifyField outcome, indexed by a code: bit 0 sparsity, bit 1 complex
+        structure, bit 2 low cardinality, 8 unstable type, 9 mandatory.
+        Scores are summed in the same order and rounded with the same round() as classifyField.
+        """
+        maxScore = sum(self.weights.values())
+        table = []
+        for code in range(8):
+            score = 0.0
+            flags = []
+            if code & 1:
+                score += self.weights["sparsity"]
+                flags.append("SPARSITY")
+            if code & 2:
+                score += self.weights["nested"]
+                flags.append("COMPLEX_STRUCTURE")
+            if code & 4:
+                score += self.weights["lowCardinality"]
+                flags.append("LOW_CARDINALITY")
+            normalizedScore = score / maxScore
+            if normalizedScore > self.threshold:
+                table.append(("MONGO", round(normalizedScore, 3), flags, "Score Threshold Exceeded"))
+            else:
+                table.append(("SQL", round(normalizedScore, 3), flags, "Safe for SQL"))
+
+        table.append(("MONGO", 1.0, ["UNSTABLE_TYPE"], "Hard Gate: Unstable Types"))
+        table.append(("BOTH", 0.0, [], "Mandatory Field"))
+        return table
+
+    def classifyBulk(self, columns: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Scores all fields at once from column arrays (fieldName, frequency, dominantType,
+        typeStability, cardinality, isNested, isArray). Same decisions, scores, flags and
+        reasons as calling classifyField on each field, in input order.
+        """
+        names = np.asarray(columns["fieldName"], dtype=object)
+        frequency = np.asarray(columns["frequency"], dtype=float)
+        stability = np.asarray(columns["typeStability"], dtype=float)
+        cardinality = np.asarray(columns["cardinality"], dtype=float)
+        dominantType = np.asarray(columns["dominantType"], dtype=object)
+        isArray = np.asarray(columns["isArray"], dtype=bool)
+
+        sparse = frequency < self.limits["densityLimit"]
+        complexStructure = isArray | np.isin(dominantType, ['object', 'dict', 'array'])
+        lowCardinality = cardinality < self.limits["cardinalityLimit"]
+
+        codes = sparse.astype(np.int8) | (complexStructure.astype(np.int8) << 1) | (lowCardinality.astype(np.int8) << 2)
+        # Same precedence as classifyField: mandatory first, then the stability hard gate
+        codes[stability < self.limits["stabilityLimit"]] = 8
+        codes[np.isin(names, list(MANDATORY_BOTH))] = 9
+
+        table = self._outcomeTable()
+        results = []
+        for name, code in zip(names.tolist(), codes.tolist()):
+            decision, score, flags, reason = table[code]
+            results.append({
+                "fieldName": name,
+                "decision": decision,
+                "score": score,
+                "flags": list(flags),
+                "reason": reason
+            })
+        return results
+
+    def classifyByCost(self, columns: Dict[str, Any], totalRecords: int,
+                       costModel: Dict[str, float] = COST_MODEL) -> List[Dict[str, Any]]:
+        """
+        Places each field on the backend that stores it in fewer estimated bytes, from the measured
+        frequency, null ratio and average serialized size (avgSize, nullRatio columns):
+        - SQL:   non-null values * avgSize + every row * sqlColumnBytes (the row-width cost of a column)
+        - MONGO: non-null values * avgSize + every present value * (key name + docFieldOverhead)
+        The total is a sum of independent per-field terms, so the per-field choice is the minimum.
+        Mandatory fields stay BOTH; type-unstable and array/object fields cannot be a typed column
+        and stay MONGO. score is the SQL share of the two costs (higher = better for Mongo).
+        """
+        names = np.asarray(columns["fieldName"], dtype=object)
+        frequency = np.asarray(columns["frequency"], dtype=float)
+        stability = np.asarray(columns["typeStability"], dtype=float)
+        dominantType = np.asarray(columns["dominantType"], dtype=object)
+        isArray = np.asarray(columns["isArray"], dtype=bool)
+        avgSize = np.asarray(columns["avgSize"], dtype=float)
+        nullRatio = np.asarray(columns["nullRatio"], dtype=float)
+        nameBytes = np.asarray([len(name.encode('utf-8')) for name in names.tolist()], dtype=float)
+
+        present = frequency * totalRecords
+        valueBytes = present * (1 - nullRatio) * avgSize
+        sqlBytes = valueBytes + totalRecords * costModel["sqlColumnBytes"]
+        mongoBytes = valueBytes + present * (nameBytes + costModel["docFieldOverhead"])
+        totalBytes = sqlBytes + mongoBytes
+        share = np.divide(sqlBytes, totalBytes, out=np.zeros_like(totalBytes), where=totalBytes > 0)
+
+        mandatory = np.isin(names, list(MANDATORY_BOTH))
+        unstable = stability < self.limits["stabilityLimit"]
+        complexStructure = isArray | np.isin(dominantType, ['object', 'dict', 'array'])
+
+        results = []
+        for i, name in enumerate(names.tolist()):
+            result = {
+                "fieldName": name,
+                "decision": "SQL",
+                "score": round(float(share[i]), 3),
+                "flags": [],
+                "reason": "Default",
+                "estimatedBytes": {"sql": round(float(sqlBytes[i])), "mongo": round(float(mongoBytes[i]))}
+            }
+            if mandatory[i]:
+                result["decision"] = "BOTH"
+                result["score"] = 0.0
+                result["reason"] = "Mandatory Field"
+            elif unstable[i]:
+                result["decision"] = "MONGO"
+                result["score"] = 1.0
+                result["flags"].append("UNSTABLE_TYPE")
+                result["reason"] = "Hard Gate: Unstable Types"
+            elif complexStructure[i]:
+                result["decision"] = "MONGO"
+                result["score"] = 1.0
+                result["flags"].append("COMPLEX_STRUCTURE")
+                result["reason"] = "Hard Gate: Complex Structure"
+            elif mongoBytes[i] < sqlBytes[i]:
+                result["decision"] = "MONGO"
+                result["flags"].append("STORAGE_COST")
+                result["reason"] = "Cost: cheaper as document fields"
+            else:
+                result["reason"] = "Cost: cheaper as a SQL column"
+            results.append(result)
+        return results
+
+def runPipeline(showTable: bool = True, mode: str = "heuristic"):
     # Load Data
     try:
-        with open('data/analyzed_data.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = load('data/analyzed_data.json')
     except FileNotFoundError:
         print("Error: analyzed_data.json not found")
         return
 
     classifier = SchemaClassifier(WEIGHTS, THRESHOLDS, MONGO_SCORE_THRESHOLD)
-    output_records = []
-
-    print(f"{'Field':<20} {'Score':<6} {'Decision':<10} {'Flags'}")
-    print("-" * 60)
-
-    for record in data['fields']:
-        stats = FieldStats(
-            fieldName=record['field_name'],
-            frequency=record['frequency'],
-            dominantType=record['dominant_type'],
-            typeStability=record['type_stability'],
-            cardinality=record['cardinality'],
-            isNested=record['is_nested'],
-            isArray=record['is_array'],
-        )
-        
-        res = classifier.classifyField(stats)
-        output_records.append(res)
-        
-        flags_str = ", ".join(res["flags"])
-        print(f"{res['fieldName']:<20} {res['score']:<6} {res['decision']:<10} {flags_str}")
+    fields = data['fields']
+    columns = {
+        "fieldName": [record['field_name'] for record in fields],
+        "frequency": [record['frequency'] for record in fields],
+        "dominantType": [record['dominant_type'] for record in fields],
+        "typeStability": [record['type_stability'] for record in fields],
+        "cardinality": [record['cardinality'] for record in fields],
+        "isNested": [record['is_nested'] for record in fields],
+        "isArray": [record['is_array'] for record in fields],
+    }
+
+    if mode == "cost":
+        if fields and 'avg_size' not in fields[0]:
+            print("analyzed_data.json has no field sizes. Re-run the analysis to use the cost model.")
+            return
+        columns["avgSize"] = [record['avg_size'] for record in fields]
+        columns["nullRatio"] = [record['null_ratio'] for record in fields]
+        output_records = classifier.classifyByCost(columns, data['total_records'])
+    elif mode == "heuristic":
+        output_records = classifier.classifyBulk(columns)
+    else:
+        print(f"Unknown classification mode '{mode}'. Use 'heuristic' or 'cost'.")
+        return
+
+    if showTable:
+        print(f"{'Field':<20} {'Score':<6} {'Decision':<10} {'Flags'}")
+        print("-" * 60)
+        for res in output_records:
+            flags_str = ", ".join(res["flags"])
+            print(f"{res['fieldName']:<20} {res['score']:<6} {res['decision']:<10} {flags_str}")
+
+    if mode == "cost":
+        sqlTotal = sum(res["estimatedBytes"]["sql"] for res in output_records if res["decision"] in ("SQL", "BOTH"))
+        mongoTotal = sum(res["estimatedBytes"]["mongo"] for res in output_records if res["decision"] in ("MONGO", "BOTH"))
+        print(f"Estimated storage: SQL {sqlTotal} bytes, MONGO {mongoTotal} bytes")
 
     # Save Results
-    with open('data/field_metadata.json', 'w', encoding='utf-8') as f:
-        json.dump(output_records, f, indent=2)
+    # Kept readable: this is the file people open to see which field goes where and why
+    dump(output_records, 'data/field_metadata.json', pretty=True)
     
 
-def run_classification():
-    runPipeline()
\ No newline at end of file
+def run_classification(showTable: bool = True, mode: str = "heuristic"):
+    runPipeline(showTable, mode)
\ No newline at end of file
@@ -1,10 +1,10 @@
 import httpx
-import json
 import os
 import subprocess
 import time
 import sys
 from datetime import datetime
+from serialization import loads, write_records
 
 def wait_for_server(url: str, timeout: int = 15):
     start_time = time.time()
@@ -30,7 +30,7 @@ def collect_data(url: str, count: int, output_file: str = "data/raw_data.json"):
         with httpx.stream("GET", url, timeout=None) as response:
             for line in response.iter_lines():
                 if line.startswith("data: "):
-                    record = json.loads(line[6:])
+                    record = loads(line[6:])
                     
                     # Add Ingestion Time
                     record['sys_ingested_time'] = datetime.now().isoformat()
@@ -45,8 +45,7 @@ def collect_data(url: str, count: int, output_file: str = "data/raw_data.json"):
     except Exception as e:
         print(f"Error collecting data: {e}")
     
-    with open(output_file, 'w') as f:
-        json.dump(records, f, indent=4)
+    write_records(records, output_file)
     
     print(f"Collection complete. {len(records)} records saved to {output_file}")
 
@@ -0,0 +1,706 @@
+"""
+Document Sink module
+
+- Pluggable store for the Mongo half of routed records, with the same interface as RecordStore
+- Splits each routed batch into insert_many calls capped by document count and serialized bytes
+- Indexes the join fields shared with the SQL side (username, timestamp, sys_ingested_time)
+- FileDocumentStore is the embedded stand-in: NDJSON segments plus one index file per segment and field
+- Upserts on the file store go to a patch log that reads fold in, until compaction rewrites the segments
+- Compaction goes one segment per compact_step() and checkpoints in the manifest, so callers can spread it out
+- MongoDocumentStore talks to MongoDB through pymongo, or to mongomock with a 'mongomock://' URI
+
+"""
+
+import os
+import heapq
+from itertools import islice
+from bisect import bisect_left, bisect_right
+
+from record_store import RecordStore
+from classifier import MANDATORY_BOTH
+from serialization import load, dump, dumpb, loads
+
+JOIN_FIELDS = tuple(sorted(MANDATORY_BOTH))
+IDENTITY = ("username", "sys_ingested_time")
+PATCH_LOG_NAME = "patches.ndjson"
+INDEX_SUFFIX = ".idx.sorted.ndjson"  # sorted index of a sealed segment, searched on disk
+INDEX_LOG_SUFFIX = ".idx.ndjson"     # append-only index log of the active segment
+OLD_INDEX_SUFFIX = ".idx.json"       # sorted index as one JSON array, written by older stores
+
+
+def _index_key(value):
+    """Sort key for an indexed value; numbers order before strings. Other values are not indexed."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return (0, value)
+    if isinstance(value, str):
+        return (1, value)
+    return None
+
+
+def _identity(doc):
+    return tuple(doc.get(field) for field in IDENTITY)
+
+
+def _positioned(entries, position):
+    # (key, segment position, offset): ties on the key merge in segment order
+    for key, offset in entries:
+        yield key, position, offset
+
+
+class SegmentIndex:
+    """Sorted (key, byte offset) pairs for one field of one segment, searched with bisect."""
+
+    def __init__(self, entries=None):
+        entries = sorted(entries or [])
+        self.keys = [key for key, _ in entries]
+        self.offsets = [offset for _, offset in entries]
+
+    def add(self, key, offset):
+        pos = bisect_right(self.keys, key)
+        self.keys.insert(pos, key)
+        self.offsets.insert(pos, offset)
+
+    def _bounds(self, low, high):
+        return bisect_left(self.keys, low), bisect_right(self.keys, high)
+
+    def range(self, low, high):
+        start, end = self._bounds(low, high)
+        return self.offsets[start:end]
+
+    def entries(self, low, high):
+        """(key, offset) pairs in [low, high], in key order."""
+        start, end = self._bounds(low, high)
+        return zip(self.keys[start:end], self.offsets[start:end])
+
+    def save(self, path):
+        """Writes the pairs as a SortedIndexFile (write-then-rename)."""
+        with open(path + ".tmp", 'wb') as f:
+            f.write(b"".join(dumpb([key[0], key[1], offset]) + b"\n"
+                             for key, offset in zip(self.keys, self.offsets)))
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def from_state(cls, state):
+        index = cls()
+        index.keys = [tuple(key) for key, _ in state]
+        index.offsets = [offset for _, offset in state]
+        return index
+
+
+class SortedIndexFile:
+    """
+    A sealed segment's index on disk: one [tag, value, offset] line per record, sorted by key and
+    then offset. A lookup bisects the file by byte position and reads only the lines in range, so
+    nothing but the requested keys is loaded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _line_start(self, f, position):
+        """Byte position of the first line starting at or after `position`."""
+        if position == 0:
+            f.seek(0)
+            return 0
+        f.seek(position - 1)
+        f.readline()
+        return f.tell()
+
+    def _seek(self, f, low):
+        """Moves f to the first line whose key is at least `low`."""
+        lo, hi = 0, os.fstat(f.fileno()).st_size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self._line_start(f, mid)
+            line = f.readline()
+            if not line or tuple(loads(line)[:2]) >= low:
+                hi = mid
+            else:
+                # Every position from mid up to this line's start leads to the same line
+                lo = start + 1
+        f.seek(self._line_start(f, lo))
+
+    def entries(self, low, high):
+        """(key, offset) pairs in [low, high], in key order, read lazily."""
+        with open(self.path, 'rb') as f:
+            self._seek(f, low)
+            for line in f:
+                tag, value, offset = loads(line)
+                if (tag, value) > high:
+                    return
+                yield (tag, value), offset
+
+    def range(self, low, high):
+        return [offset for _, offset in self.entries(low, high)]
+
+
+class FileDocumentStore(RecordStore):
+    """
+    RecordStore with secondary indexes, one file per segment and field. While a segment is active,
+    every stored record appends its (key, byte offset) to the segment's index log
+    (segment_000001.ndjson.username.idx.ndjson). Once the segment is sealed the log is sorted once
+    into segment_000001.ndjson.username.idx.sorted.ndjson. A lookup bisects the requested field's
+    sorted file of each sealed segment on disk (the active segment's index is held in memory) and
+    reads only the matching lines by offset.
+    """
+
+    def __init__(self, directory, **options):
+        super().__init__(directory, **options)
+        self.manifest.setdefault("indexes", [])
+        self.indexes = {}       # (segment file, field) -> SegmentIndex of the active segment
+        self.index_log = []     # (segment, field, key, offset) waiting to be appended to the index logs
+        self.patch_path = os.path.join(directory, PATCH_LOG_NAME)
+        self.patches = None     # identity -> folded patch, loaded on first use
+
+    def insert_many(self, docs):
+        return self.append(docs)
+
+    def _load_patches(self):
+        if self.patches is not None:
+            return self.patches
+
+        self.patches = {}
+        torn = False
+        if os.path.exists(self.patch_path):
+            with open(self.patch_path, 'rb') as f:
+                for line in f:
+                    try:
+                        patch = loads(line)
+                    except ValueError:
+                        torn = True   # only the last line can be cut short; its chunk is copied again
+                        continue
+                    self.patches.setdefault(_identity(patch), {}).update(patch)
+        if torn:
+            # Later appends must not land on the end of the cut line
+            with open(self.patch_path, 'wb') as f:
+                f.write(b"".join(dumpb(patch) + b"\n" for patch in self.patches.values()))
+        return self.patches
+
+    def _patched(self, doc):
+        patch = self.patches.get(_identity(doc)) if self.patches else None
+        if patch:
+            doc.update(patch)
+        return doc
+
+    def _stored(self, identities):
+        """identity -> the stored document (patches applied), for the identities already in the store."""
+        found = {}
+        field = IDENTITY[-1]
+        rest = set(identities)
+        if field in self.manifest["indexes"]:
+            for identity in identities:
+                if _index_key(identity[-1]) is None:
+                    continue
+                rest.discard(identity)
+                for doc in self.find(field, identity[-1]):
+                    if _identity(doc) == identity:
+                        found[identity] = doc
+                        break
+        if rest:
+            for doc in self.iter_records():
+                identity = _identity(doc)
+                if identity in rest:
+                    found.setdefault(identity, doc)
+        return found
+
+    def upsert_many(self, patches):
+        """
+        Sets each patch on the stored document with the same username + sys_ingested_time, creating
+        it if missing. Patches for stored documents are appended to the patch log and folded into the
+        document by every read; they change neither count() nor the segments until compact().
+        Applying the same patches again has no further effect.
+        """
+        if not patches:
+            return 0
+
+        folded = self._load_patches()
+        stored = self._stored({_identity(patch) for patch in patches})
+        indexed = [field for field in self.manifest["indexes"] if field not in IDENTITY]
+
+        logged = []
+        created = {}
+        reindex = False
+        for patch in patches:
+            identity = _identity(patch)
+            doc = stored.get(identity)
+            if doc is None:
+                created.setdefault(identity, {}).update(patch)
+                continue
+            if all(key in doc and doc[key] == value for key, value in patch.items()):
+                continue   # already applied, e.g. a chunk copied again after a crash
+            # The indexes hold the stored values, so a patch that moves an indexed value needs a rewrite
+            reindex = reindex or any(_index_key(doc.get(field)) != _index_key(patch[field])
+                                     for field in indexed if field in patch)
+            logged.append(patch)
+
+        if logged:
+            os.makedirs(self.directory, exist_ok=True)
+            if self.manifest.pop("compact_next", None):
+                # A compaction under way may already have passed these documents' segments
+                self._save_manifest()
+            with open(self.patch_path, 'ab') as f:
+                f.write(b"".join(dumpb(patch) + b"\n" for patch in logged))
+            for patch in logged:
+                folded.setdefault(_identity(patch), {}).update(patch)
+
+        self.append(list(created.values()))
+        if reindex:
+            self.compact()
+        return len(patches)
+
+    def compacting(self):
+        """True while the patch log holds upserts that are not written into the segments yet."""
+        return bool(self._load_patches())
+
+    def compact_step(self):
+        """
+        Goes through the next segment of a compaction and, if it holds a patched document, rewrites
+        it with its patches applied. The rewritten segment goes to a new file, and the manifest
+        switches to it and moves the checkpoint ("compact_next") on in one atomic save, so a crash
+        resumes at the same segment. After the last segment the patch log is dropped. Returns 1 if
+        the segment was rewritten, else 0.
+        """
+        patches = self._load_patches()
+        if not patches:
+            return 0
+
+        position = self.manifest.get("compact_next", 0)
+        if position >= len(self.manifest["segments"]):
+            # Checkpoint first: a crash before the patch log is gone only means another pass
+            self.manifest.pop("compact_next", None)
+            self._save_manifest()
+            os.remove(self.patch_path)
+            self.patches = {}
+            return 0
+
+        segment = self.manifest["segments"][position]
+        path = self._segment_path(segment)
+        lines = []
+        changed = False
+        for _, line in self._segment_lines(segment):
+            if not line.strip():
+                continue
+            doc = loads(line)
+            patch = patches.get(_identity(doc))
+            if patch:
+                doc.update(patch)
+                line = dumpb(doc) + b"\n"
+                changed = True
+            lines.append(line if line.endswith(b"\n") else line + b"\n")
+
+        self.manifest["compact_next"] = position + 1
+        if not changed:
+            self._save_manifest()
+            return 0
+
+        generation = segment.get("generation", 0) + 1
+        replacement = dict(segment, file=f"segment_{position + 1:06d}_{generation}.ndjson",
+                           generation=generation, bytes=sum(len(line) for line in lines))
+        with open(self._segment_path(replacement), 'wb') as f:
+            f.write(b"".join(lines))
+        self.manifest["segments"][position] = replacement
+        self._save_manifest()
+
+        self._remove_indexes(segment)
+        os.remove(path)
+        return 1
+
+    def compact(self):
+        """Runs compact_step until the patch log is gone. Returns the number of segments rewritten."""
+        rewritten = 0
+        while self.compacting():
+            rewritten += self.compact_step()
+        return rewritten
+
+    def create_index(self, field):
+        if field not in self.manifest["indexes"]:
+            self.manifest["indexes"].append(field)
+            if os.path.exists(self.directory):
+                self._save_manifest()
+
+    def _new_segment(self):
+        # A crash before the manifest save can leave index files behind under the new segment's name
+        segment = super()._new_segment()
+        self._remove_indexes(segment)
+        return segment
+
+    def adopt(self, directory):
+        """
+        Moves the segments of another file store (a parallel backfill worker's) to the end of this
+        one. Segment and index files are renamed, not rewritten. Returns the number of documents.
+        """
+        staged = FileDocumentStore(directory)
+        if not staged.manifest["segments"]:
+            return 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        for segment in staged.manifest["segments"]:
+            moved = self._new_segment()
+            moved["records"], moved["bytes"] = segment["records"], segment["bytes"]
+            os.replace(staged._segment_path(segment), self._segment_path(moved))
+            for field in self.manifest["indexes"]:
+                if field not in staged.manifest["indexes"]:
+                    continue
+                for suffix in (INDEX_SUFFIX, INDEX_LOG_SUFFIX, OLD_INDEX_SUFFIX):
+                    path = staged._index_path(segment, field, suffix)
+                    if os.path.exists(path):
+                        os.replace(path, self._index_path(moved, field, suffix))
+
+        self.manifest["total_records"] += staged.count()
+        self._save_manifest()
+        return staged.count()
+
+    def _index_path(self, segment, field, suffix):
+        return f"{self._segment_path(segment)}.{field}{suffix}"
+
+    def append(self, records):
+        # The active segment's logs must hold every earlier record before new entries are appended
+        # (stores written before index logs existed, or an index created after the segment started)
+        segments = self.manifest["segments"]
+        if records and segments and segments[-1]["records"] and not self._is_full(segments[-1]):
+            for field in self.manifest["indexes"]:
+                if not os.path.exists(self._index_path(segments[-1], field, INDEX_LOG_SUFFIX)):
+                    self._segment_index(segments[-1], field)
+
+        count = super().append(records)
+        self._flush_index_log()
+        return count
+
+    def _written(self, segment, offset, record):
+        for field in self.manifest["indexes"]:
+            key = _index_key(record.get(field))
+            if key is None:
+                continue
+            self.index_log.append((segment, field, key, offset))
+            index = self.indexes.get((segment["file"], field))
+            if index is not None:
+                index.add(key, offset)
+
+    def _flush_index_log(self):
+        lines = {}
+        for segment, field, key, offset in self.index_log:
+            lines.setdefault(self._index_path(segment, field, INDEX_LOG_SUFFIX), []).append(
+                dumpb([key[0], key[1], offset]) + b"\n")
+        for path, chunk in lines.items():
+            with open(path, 'ab') as f:
+                f.write(b"".join(chunk))
+        self.index_log = []
+
+    def iter_records(self):
+        self._load_patches()
+        for doc in super().iter_records():
+            yield self._patched(doc)
+
+    def _is_sealed(self, segment):
+        return segment is not self.manifest["segments"][-1] or self._is_full(segment)
+
+    def _scan_index(self, segment, field, after=-1):
+        """(key, offset) of the records stored after byte offset `after` (the whole segment for -1)."""
+        entries = []
+        for offset, line in self._segment_lines(segment, max(after, 0)):
+            if offset > after and line.strip():
+                key = _index_key(loads(line).get(field))
+                if key is not None:
+                    entries.append((key, offset))
+        return entries
+
+    def _load_index_log(self, segment, field):
+        """
+        Reads a segment's index log. Records the log does not cover yet (the process stopped between
+        writing a batch and its log entries, or there is no log) are indexed from the segment's tail.
+        """
+        path = self._index_path(segment, field, INDEX_LOG_SUFFIX)
+        entries = []
+        torn = False
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        tag, value, offset = loads(line)
+                    except ValueError:
+                        torn = True   # only the last line can be cut short
+                        continue
+                    if offset >= segment["bytes"]:
+                        torn = True   # logged for a line the manifest never recorded
+                        continue
+                    entries.append(((tag, value), offset))
+
+        last = max((offset for _, offset in entries), default=-1)
+        missed = self._scan_index(segment, field, last)
+        if torn or missed or not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, 'wb' if torn else 'ab') as f:
+                for key, offset in (entries + missed if torn else missed):
+                    f.write(dumpb([key[0], key[1], offset]) + b"\n")
+        return SegmentIndex(entries + missed)
+
+    def _segment_index(self, segment, field):
+        """
+        The index of one segment and field: a SortedIndexFile once the segment is sealed, the
+        in-memory SegmentIndex (kept up to date by _written) while it is active.
+        """
+        cache_key = (segment["file"], field)
+        if not self._is_sealed(segment):
+            index = self.indexes.get(cache_key)
+            if index is None:
+                index = self.indexes[cache_key] = self._load_index_log(segment, field)
+            return index
+
+        sorted_path = self._index_path(segment, field, INDEX_SUFFIX)
+        if not os.path.exists(sorted_path):
+            # Sealed segments never change: sort the log (or convert an older index) once
+            old_path = self._index_path(segment, field, OLD_INDEX_SUFFIX)
+            index = self.indexes.pop(cache_key, None)
+            if index is None and os.path.exists(old_path):
+                index = SegmentIndex.from_state(load(old_path))
+            elif index is None:
+                index = self._load_index_log(segment, field)
+            index.save(sorted_path)
+            for path in (old_path, self._index_path(segment, field, INDEX_LOG_SUFFIX)):
+                if os.path.exists(path):
+                    os.remove(path)
+        self.indexes.pop(cache_key, None)
+        return SortedIndexFile(sorted_path)
+
+    def find_range(self, field, low, high, ordered=False):
+        """
+        Yields the documents whose field lies in [low, high]. By default segment by segment in
+        insertion order; ordered=True yields them in field order instead (ties in insertion order),
+        merging the per-segment indexes lazily.
+        """
+        if field not in self.manifest["indexes"]:
+            raise ValueError(f"No index on '{field}'. Call create_index first.")
+        low_key, high_key = _index_key(low), _index_key(high)
+        if low_key is None or high_key is None:
+            raise ValueError("Only number and string values are indexed.")
+
+        self._load_patches()
+        if ordered:
+            yield from self._find_ordered(field, low_key, high_key)
+            return
+
+        for segment in self.manifest["segments"]:
+            offsets = sorted(self._segment_index(segment, field).range(low_key, high_key))
+            if not offsets:
+                continue
+            with open(self._segment_path(segment), 'rb') as f:
+                for offset in offsets:
+                    f.seek(offset)
+                    yield self._patched(loads(f.readline()))
+
+    def _find_ordered(self, field, low_key, high_key):
+        streams = []
+        for position, segment in enumerate(self.manifest["segments"]):
+            entries = self._segment_index(segment, field).entries(low_key, high_key)
+            streams.append(_positioned(entries, position))
+
+        files = {}
+        try:
+            for key, position, offset in heapq.merge(*streams):
+                f = files.get(position)
+                if f is None:
+                    f = files[position] = open(self._segment_path(self.manifest["segments"][position]), 'rb')
+                f.seek(offset)
+                yield self._patched(loads(f.readline()))
+        finally:
+            for f in files.values():
+                f.close()
+
+    def find(self, field, value):
+        return self.find_range(field, value, value)
+
+    def _remove_indexes(self, segment):
+        # Both index files of every indexed field, plus the single all-fields file of older stores
+        paths = [self._segment_path(segment) + OLD_INDEX_SUFFIX]
+        for field in self.manifest["indexes"]:
+            paths += [self._index_path(segment, field, suffix)
+                      for suffix in (INDEX_SUFFIX, INDEX_LOG_SUFFIX, OLD_INDEX_SUFFIX)]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        for field in self.manifest["indexes"]:
+            self.indexes.pop((segment["file"], field), None)
+
+    def clear(self):
+        for segment in self.manifest["segments"]:
+            self._remove_indexes(segment)
+        indexed = list(self.manifest["indexes"])
+        super().clear()
+        self.manifest["indexes"] = indexed
+        self.indexes = {}
+        self.index_log = []
+        if os.path.exists(self.patch_path):
+            os.remove(self.patch_path)
+        self.patches = {}
+        self.manifest.pop("compact_next", None)
+        if os.path.exists(self.directory):
+            self._save_manifest()
+
+
+class MongoDocumentStore:
+    """Adapter over a pymongo (or mongomock) collection with the FileDocumentStore interface."""
+
+    def __init__(self, uri, database="cs432", collection="records"):
+        if uri.startswith("mongomock://"):
+            import mongomock   # optional, only for local runs without a server
+            client = mongomock.MongoClient()
+            driver = mongomock
+        else:
+            import pymongo     # optional, only needed with a real MongoDB
+            client = pymongo.MongoClient(uri)
+            driver = pymongo
+        self.client = client
+        self.collection = client[database][collection]
+        # Bulk operation class of the loaded driver; mongomock only has one when pymongo is installed
+        self.update_one = getattr(driver, "UpdateOne", None)
+
+    def insert_many(self, docs):
+        # pymongo adds _id to the dicts it inserts; the caller's documents are left untouched
+        self.collection.insert_many([dict(doc) for doc in docs], ordered=False)
+        return len(docs)
+
+    def upsert_many(self, patches, identity=IDENTITY):
+        """$set each patch on the document with the same identity fields, creating it if missing."""
+        updates = [({field: patch.get(field) for field in identity}, {"$set": patch}) for patch in patches]
+        if not updates:
+            return 0
+        if self.update_one is None:
+            # No operation objects to bulk_write with: one in-process call per patch
+            for query, update in updates:
+                self.collection.update_one(query, update, upsert=True)
+        else:
+            self.collection.bulk_write([self.update_one(query, update, upsert=True) for query, update in updates],
+                                       ordered=False)
+        return len(updates)
+
+    def create_index(self, field):
+        self.collection.create_index(field)
+
+    def iter_records(self):
+        return self.collection.find({}, {"_id": 0}).sort("_id", 1)
+
+    def find_range(self, field, low, high, ordered=False):
+        order = [(field, 1), ("_id", 1)] if ordered else [("_id", 1)]
+        return self.collection.find({field: {"$gte": low, "$lte": high}}, {"_id": 0}).sort(order)
+
+    def find(self, field, value):
+        return self.collection.find({field: value}, {"_id": 0}).sort("_id", 1)
+
+    def count(self):
+        return self.collection.count_documents({})
+
+    def clear(self):
+        self.collection.delete_many({})
+
+    def close(self):
+        self.client.close()
+
+
+class DocumentSink:
+    """
+    What the router appends to. Each batch becomes as few insert_many calls as the limits allow:
+    a call holds at most max_batch_docs documents and, when max_batch_bytes is set, at most that
+    many serialized bytes (MongoDB rejects bulk messages over 48MB).
+    """
+
+    def __init__(self, store, max_batch_docs=1000, max_batch_bytes=None, index_fields=JOIN_FIELDS):
+        self.store = store
+        self.max_batch_docs = max_batch_docs
+        self.max_batch_bytes = max_batch_bytes
+        self.stats = {"documents": 0, "bulk_writes": 0}
+        for field in index_fields:
+            store.create_index(field)
+
+    def _chunks(self, docs):
+        if not self.max_batch_bytes:
+            for i in range(0, len(docs), self.max_batch_docs):
+                yield docs[i:i + self.max_batch_docs]
+            return
+
+        chunk = []
+        size = 0
+        for doc in docs:
+            doc_bytes = len(dumpb(doc))
+            if chunk and (len(chunk) >= self.max_batch_docs or size + doc_bytes > self.max_batch_bytes):
+                yield chunk
+                chunk = []
+                size = 0
+            chunk.append(doc)
+            size += doc_bytes
+        if chunk:
+            yield chunk
+
+    def append(self, docs):
+        if not docs:
+            return 0
+        for chunk in self._chunks(docs):
+            self.store.insert_many(chunk)
+            self.stats["bulk_writes"] += 1
+        self.stats["documents"] += len(docs)
+        return len(docs)
+
+    def upsert(self, patches):
+        """Bulk upserts, split into the same count / byte bounded calls as append."""
+        for chunk in self._chunks(patches):
+            self.store.upsert_many(chunk)
+            self.stats["bulk_writes"] += 1
+        return len(patches)
+
+    def compact(self):
+        """Folds pending upserts into the stored documents where the store defers them (the file store)."""
+        if hasattr(self.store, "compact"):
+            return self.store.compact()
+        return 0
+
+    def compacting(self):
+        return hasattr(self.store, "compacting") and self.store.compacting()
+
+    def compact_step(self):
+        """One bounded piece of compact(): at most one segment is rewritten."""
+        if hasattr(self.store, "compact_step"):
+            return self.store.compact_step()
+        return 0
+
+    def adopt(self, directory):
+        """Appends the documents a backfill worker staged in a file store at `directory`."""
+        if hasattr(self.store, "adopt"):
+            count = self.store.adopt(directory)
+        else:
+            docs = FileDocumentStore(directory).iter_records()
+            count = 0
+            while True:
+                chunk = list(islice(docs, self.max_batch_docs))
+                if not chunk:
+                    break
+                count += self.append(chunk)
+            return count
+        self.stats["documents"] += count
+        return count
+
+    def iter_records(self):
+        return self.store.iter_records()
+
+    def find(self, field, value):
+        return self.store.find(field, value)
+
+    def find_range(self, field, low, high, ordered=False):
+        return self.store.find_range(field, low, high, ordered)
+
+    def count(self):
+        return self.store.count()
+
+    def clear(self):
+        self.store.clear()
+
+    def close(self):
+        if hasattr(self.store, "close"):
+            self.store.close()
+
+
+def open_document_sink(uri, directory):
+    """An unset URI selects the embedded file store in `directory`; otherwise MongoDB (or mongomock)."""
+    if not uri:
+        return DocumentSink(FileDocumentStore(directory))
+    return DocumentSink(MongoDocumentStore(uri), max_batch_bytes=16 * 1024 * 1024)
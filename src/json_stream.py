@@ -0,0 +1,76 @@
+"""
+JSON Stream module
+
+- Reads records one at a time from either NDJSON or a top-level JSON array, without loading the file
+- Memory use depends on the largest single record, not on the file size
+- A record longer than a chunk is read in growing chunks, so decoding it again stays linear in its size
+- A JSON array cut off before its closing ']' raises ValueError instead of ending quietly
+
+"""
+
+import json
+
+from serialization import loads
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+
+def _first_char(f):
+    while True:
+        ch = f.read(1)
+        if ch == "" or ch not in _WHITESPACE:
+            return ch
+
+
+def iter_json_records(path, chunk_size=1 << 16):
+    """Yields each record of a JSON array file or an NDJSON file, detected from the first character."""
+    with open(path, 'r', encoding='utf-8') as f:
+        first = _first_char(f)
+        if first == "":
+            return
+
+        if first != "[":
+            # NDJSON: one record per line
+            f.seek(0)
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield loads(line)
+            return
+
+        buf = ""
+        pos = 0
+        eof = False
+        while True:
+            # Skip separators between array items
+            while pos < len(buf) and (buf[pos] in _WHITESPACE or buf[pos] == ","):
+                pos += 1
+
+            if pos < len(buf) and buf[pos] == "]":
+                return
+
+            try:
+                if pos >= len(buf):
+                    raise ValueError("need more data")
+                item, end = _decoder.raw_decode(buf, pos)
+                # A value that runs to the very end of the buffer may have been cut short
+                if end == len(buf) and not eof:
+                    raise ValueError("need more data")
+            except ValueError:
+                if eof:
+                    if pos >= len(buf):
+                        raise ValueError(f"{path}: the JSON array ends before its closing ']'")
+                    raise
+                # The partial record is decoded again from its start on the next try. Reading at
+                # least as much as is already buffered doubles the buffer each time, so a large
+                # record costs a linear number of decoded characters, not a quadratic one.
+                chunk = f.read(max(chunk_size, len(buf) - pos))
+                eof = chunk == ""
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+
+            yield item
+            pos = end
+
@@ -0,0 +1,133 @@
+"""
+Log Sink module
+
+- Structured router log: one compact JSON object per line instead of multi-line text blocks
+- Lines are buffered in memory and written in chunks; the file rotates by size or age
+- Verbosity levels go from per-field decisions down to per-batch summaries (or nothing at all)
+
+"""
+
+import os
+import shutil
+from serialization import dumps
+import time
+from datetime import datetime
+
+LEVELS = {"off": 0, "batch": 1, "record": 2, "field": 3}
+
+
+class RouterLog:
+    def __init__(self, path=None, level="field", buffer_bytes=256 * 1024,
+                 max_bytes=10 * 1024 * 1024, max_age=None, backups=5):
+        """
+        path=None keeps lines in memory only (see drain), which is how worker processes log.
+        max_age is in seconds; None disables time-based rotation.
+        """
+        if level not in LEVELS:
+            raise ValueError(f"Unknown log level '{level}'. Use one of: {', '.join(LEVELS)}")
+
+        self.path = path
+        self.level = LEVELS[level]
+        self.buffer_bytes = buffer_bytes
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backups = backups
+
+        self.buffer = []
+        self.buffered = 0
+        self.opened_at = time.time()
+
+    @property
+    def records_enabled(self):
+        return self.level >= LEVELS["record"]
+
+    def _emit(self, entry):
+        line = dumps(entry) + "\n"
+        self.buffer.append(line)
+        self.buffered += len(line)
+        if self.path is not None and self.buffered >= self.buffer_bytes:
+            self.flush()
+
+    def record(self, ingestTime, fieldCount, sqlDoc, mongoDoc):
+        """Per-record entry. At 'field' level the routed field names per backend are included."""
+        if self.level == LEVELS["field"]:
+            self._emit({"t": ingestTime, "fields": fieldCount, "sql": list(sqlDoc), "mongo": list(mongoDoc)})
+        else:
+            self._emit({"t": ingestTime, "fields": fieldCount, "sql": len(sqlDoc), "mongo": len(mongoDoc)})
+
+    def batch(self, event, **counts):
+        if self.level >= LEVELS["batch"]:
+            self._emit({"event": event, "at": datetime.now().isoformat(), **counts})
+
+    def write_lines(self, text):
+        """Appends already-serialized lines, e.g. the drained buffer of a worker process."""
+        if text:
+            self.buffer.append(text)
+            self.buffered += len(text)
+            if self.path is not None and self.buffered >= self.buffer_bytes:
+                self.flush()
+
+    def append_file(self, path):
+        """Appends a finished log file, e.g. a worker process's part, after the lines logged so far."""
+        if self.path is None or not os.path.exists(path):
+            return
+        self.flush()
+        self._rotate_if_needed()
+        with open(path, 'rb') as part, open(self.path, 'ab') as f:
+            shutil.copyfileobj(part, f)
+
+    def drain(self):
+        text = "".join(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+        return text
+
+    def flush(self):
+        if self.path is None or not self.buffer:
+            return
+
+        self._rotate_if_needed()
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(self.drain())
+
+    def _rotated_path(self, n):
+        root, ext = os.path.splitext(self.path)
+        return f"{root}.{n}{ext}"
+
+    def _rotate_if_needed(self):
+        if not os.path.exists(self.path):
+            self.opened_at = time.time()
+            return
+
+        too_big = os.path.getsize(self.path) >= self.max_bytes
+        too_old = self.max_age is not None and time.time() - self.opened_at >= self.max_age
+        if not (too_big or too_old):
+            return
+
+        oldest = self._rotated_path(self.backups)
+        if os.path.exists(oldest):
+            os.remove(oldest)
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists(self._rotated_path(n)):
+                os.replace(self._rotated_path(n), self._rotated_path(n + 1))
+        if self.backups > 0:
+            os.replace(self.path, self._rotated_path(1))
+        else:
+            os.remove(self.path)
+        self.opened_at = time.time()
+
+    def close(self):
+        self.flush()
+
+    def clear(self):
+        """Drops the buffer, the active log and every rotated file."""
+        self.drain()
+        for path in [self.path] + [self._rotated_path(n) for n in range(1, self.backups + 1)]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,28 +1,32 @@
 import sys
 import os
-import json
 from client import run_data_collection
 from normalizer import run_field_normalization
 from analyzer import run_data_analysis
 from classifier import run_classification
 from classification_visualiser import run_visualization
 # Import both functions from our new router_logger
-from router_logger import processAndSplit, processBatch 
+from router_logger import processAndSplit, processBatch, openRecordStores, openRouterLog
+from router_service import run_router_service
+from sweep import run_sweep
+from record_query import RecordQuery
+from migration import run_migrations
+from serialization import dumps
 
-def run_initialization():
+def run_initialization(workers=1):
     print(">>> Starting System Initialization (Training Phase)...")
     
     # 1. Collect 1000 records to learn the schema
     print("\n--- Step 1: Data Collection ---")
     run_data_collection()
     
-    # 2. Normalize the data (flatten structure)
+    # 2. Normalize the data (flatten structure), one record at a time
     print("\n--- Step 2: Normalization ---")
-    run_field_normalization()
+    run_field_normalization(stream=True)
     
     # 3. Analyze fields (calculate stats like sparsity, cardinality)
     print("\n--- Step 3: Data Analysis ---")
-    run_data_analysis()
+    run_data_analysis(workers=workers)
     
     # 4. Classify fields (Generate field_metadata.json)
     print("\n--- Step 4: Classification ---")
@@ -44,46 +48,79 @@ def run_initialization():
     
     print("\n>>> Initialization Complete. Rules generated and data routed.")
 
+def run_reclassification(mode):
+    print(f"\n>>> Re-classifying fields from the cached analysis ({mode} mode)...")
+    run_classification(mode=mode)
+    run_visualization()
+
 def run_router(count):
     print(f"\n>>> Starting Router for {count} records...")
     print("Using rules from 'field_metadata.json' to route data.")
     processAndSplit(count)
 
+def run_backfill(source_file, workers):
+    print(f"\n>>> Re-routing {source_file} with {workers} worker processes...")
+    processBatch(source_file, workers=workers)
+
+def run_service(batch_size, flush_interval, online=False):
+    print("\n>>> Starting resident router service...")
+    if online:
+        print("Online reclassification enabled.")
+    run_router_service(batch_size=batch_size, flush_interval=flush_interval, online=online)
+
+def run_query(kind, args):
+    sql_store, doc_store = openRecordStores()
+    query = RecordQuery(sql_store, doc_store)
+    if kind == "user":
+        results = query.by_user(args[0])
+    elif kind == "ingest":
+        results = query.by_ingest_time(args[0])
+    else:
+        results = query.by_time_range(args[0], args[1], *args[2:3])
+
+    count = 0
+    for record in results:
+        print(dumps(record))
+        count += 1
+    print(f">>> {count} records.", file=sys.stderr)
+
 def clear_logs():
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    log_path = os.path.join(script_dir, '..', 'data', 'router_logger.txt')
-    
-    with open(log_path, 'w') as f:
-        pass # Truncate file
+    openRouterLog().clear()
     print(">>> Logs cleared.")
 
 def clear_records():
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    sql_path = os.path.join(script_dir, '..', 'data', 'sql_records.json')
-    mongo_path = os.path.join(script_dir, '..', 'data', 'mongo_records.json')
-    
-    # Initialize with empty lists
-    with open(sql_path, 'w') as f:
-        json.dump([], f)
-        
-    with open(mongo_path, 'w') as f:
-        json.dump([], f)
+    sql_store, mongo_store = openRecordStores()
+    sql_store.clear()
+    mongo_store.clear()
         
     print(">>> SQL and Mongo records cleared.")
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage:")
-        print("  python main.py initialise       -> Runs pipeline & routes initial batch")
+        print("  python main.py initialise [workers] -> Runs pipeline & routes initial batch")
         print("  python main.py router <count>   -> Routes <count> new records")
-        print("  python main.py clearLogs        -> Clears router_logger.txt")
-        print("  python main.py clearRecords     -> Clears sql and mongo jsons")
+        print("  python main.py backfill <file> [workers] -> Re-routes a stored raw JSON file in parallel")
+        print("  python main.py serve [batch] [flushSecs] [--online] -> Runs the resident router service")
+        print("  python main.py classify [heuristic|cost] -> Re-classifies fields from the cached analysis")
+        print("  python main.py sweep [gridFile] [workers] -> Scores a grid of classifier settings on the cached analysis")
+        print("  python main.py migrate [chunk] [rowsPerSec] -> Moves SQL history of fields reclassified to MONGO")
+        print("  python main.py query user <username> | ingest <time> | range <start> <end> [field]")
+        print("                                  -> Prints whole records reassembled from both stores")
+        print("  python main.py clearLogs        -> Clears router_logger.jsonl and its rotated files")
+        print("  python main.py clearRecords     -> Empties the SQLite records table and the document store")
         sys.exit(1)
 
     command = sys.argv[1]
 
     if command == "initialise":
-        run_initialization()
+        workers = 1
+        if len(sys.argv) > 2:
+            try:
+                workers = int(sys.argv[2])
+            except ValueError:
+                print("Invalid worker count provided. Defaulting to 1.")
+        run_initialization(workers)
 
     elif command == "router":
         count = 10
@@ -93,7 +130,72 @@ if __name__ == "__main__":
             except ValueError:
                 print("Invalid count provided. Defaulting to 10.")
         run_router(count)
+
+    elif command == "backfill":
+        if len(sys.argv) < 3:
+            print("Usage: python main.py backfill <raw_json_file> [workers]")
+            sys.exit(1)
+        workers = os.cpu_count() or 1
+        if len(sys.argv) > 3:
+            try:
+                workers = int(sys.argv[3])
+            except ValueError:
+                print(f"Invalid worker count provided. Defaulting to {workers}.")
+        run_backfill(sys.argv[2], workers)
+
+    elif command == "serve":
+        batch_size = 500
+        flush_interval = 5.0
+        online = "--online" in sys.argv
+        args = [arg for arg in sys.argv[2:] if arg != "--online"]
+        try:
+            if len(args) > 0:
+                batch_size = int(args[0])
+            if len(args) > 1:
+                flush_interval = float(args[1])
+        except ValueError:
+            print("Invalid serve options provided. Using batch size 500, flush every 5s.")
+            batch_size, flush_interval = 500, 5.0
+        run_service(batch_size, flush_interval, online)
         
+    elif command == "classify":
+        mode = sys.argv[2] if len(sys.argv) > 2 else "heuristic"
+        if mode not in ("heuristic", "cost"):
+            print(f"Unknown classification mode '{mode}'. Use 'heuristic' or 'cost'.")
+            sys.exit(1)
+        run_reclassification(mode)
+
+    elif command == "sweep":
+        grid_file = None
+        workers = None
+        for arg in sys.argv[2:]:
+            if arg.isdigit():
+                workers = int(arg)
+            else:
+                grid_file = arg
+        run_sweep(grid_file, workers)
+
+    elif command == "migrate":
+        chunk_size = 500
+        rows_per_second = None
+        try:
+            if len(sys.argv) > 2:
+                chunk_size = int(sys.argv[2])
+            if len(sys.argv) > 3:
+                rows_per_second = float(sys.argv[3])
+        except ValueError:
+            print("Invalid migrate options provided. Using chunks of 500 rows, unthrottled.")
+            chunk_size, rows_per_second = 500, None
+        run_migrations(chunk_size, rows_per_second)
+
+    elif command == "query":
+        arity = {"user": 1, "ingest": 1, "range": 2}
+        kind = sys.argv[2] if len(sys.argv) > 2 else None
+        if kind not in arity or len(sys.argv) < 3 + arity[kind]:
+            print("Usage: python main.py query user <username> | ingest <time> | range <start> <end> [field]")
+            sys.exit(1)
+        run_query(kind, sys.argv[3:])
+
     elif command == "clearLogs":
         clear_logs()
         
@@ -0,0 +1,160 @@
+"""
+Migration module
+
+- Moves the stored SQL values of a field that was reclassified to MONGO over to the document store
+- Works in bounded chunks in row id order: copy to documents (keyed by the join fields), NULL in SQL, checkpoint
+- Progress lives in data/migrations.json, so a crash resumes from the last finished chunk
+- Throttled: the router service runs one chunk per flush, 'main.py migrate' caps rows per second
+- Once the queue drains, the document store compacts one segment per step instead of all at once
+- Reads migrations.json only when it changed on disk, and takes the field decisions from the caller
+
+"""
+
+import os
+import time
+from datetime import datetime
+
+from classifier import MANDATORY_BOTH
+from router_logger import (
+    migrationsFile, migrationsLock, loadClassificationMap, loadMigrations, saveMigrations, openRecordStores
+)
+
+JOIN_FIELDS = tuple(sorted(MANDATORY_BOTH))
+
+
+class MigrationEngine:
+    """
+    A chunk is written to the document store before it is cleared in SQL and checkpointed.
+    A crash in between only means the chunk is copied again next time. Copies are upserts keyed
+    by username + sys_ingested_time, and upserting the same values twice leaves the store as one
+    upsert does, with no extra documents. Once the queue drains, each step rewrites one segment of
+    the embedded file store with its patches applied, until the patch log is gone.
+    """
+
+    def __init__(self, sqlStore, docStore, chunkSize=500, rowsPerSecond=None, decisions=None):
+        self.sqlStore = sqlStore
+        self.docStore = docStore
+        self.chunkSize = chunkSize
+        self.rowsPerSecond = rowsPerSecond
+        # {field: decision}; the router service passes its live RoutingPlan.schemaMap
+        self.decisions = decisions if decisions is not None else loadClassificationMap()
+        self.stats = {"chunks": 0, "rows_moved": 0, "fields_done": 0, "segments_compacted": 0}
+        self.state = {"fields": {}}
+        self.stateKey = None
+
+    def _fileKey(self):
+        # Saves are atomic renames, so a new inode means a new file even within the same mtime tick
+        try:
+            stat = os.stat(migrationsFile)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _load(self):
+        """The migration state, re-read only when registerMigrations (or another process) rewrote it."""
+        key = self._fileKey()
+        if key is None:
+            self.state, self.stateKey = {"fields": {}}, None
+        elif key != self.stateKey:
+            self.state, self.stateKey = loadMigrations(), key
+        return self.state
+
+    def _save(self, field, job):
+        """
+        Writes back one job. The router thread may have queued fields since the state was read
+        (or queued this one again, which restarts it), so the file is re-read under the lock.
+        """
+        with migrationsLock:
+            state = loadMigrations()
+            current = state["fields"].get(field)
+            if current is None or current.get("registered_at") == job.get("registered_at"):
+                state["fields"][field] = job
+            saveMigrations(state)
+            self.state, self.stateKey = state, self._fileKey()
+
+    def _pending(self, state):
+        return [field for field, job in state["fields"].items() if job["status"] in ("pending", "running")]
+
+    def pending(self):
+        return self._pending(self._load())
+
+    def busy(self):
+        """True while fields are queued or the document store still has a compaction to finish."""
+        return bool(self.pending()) or self.docStore.compacting()
+
+    def _finish(self, state, field, status):
+        job = state["fields"][field]
+        job["status"] = status
+        job["completed_at"] = datetime.now().isoformat()
+        self._save(field, job)
+        if status == "done":
+            self.stats["fields_done"] += 1
+            print(f"Migration of '{field}' finished: {job['moved']} values moved to MONGO.")
+        else:
+            print(f"Migration of '{field}' cancelled: the field is no longer routed to MONGO.")
+
+    def step(self):
+        """
+        Migrates one chunk of the oldest unfinished field, or with nothing queued rewrites one segment
+        of a pending compaction. Returns the number of values moved.
+        """
+        state = self._load()
+        fields = self._pending(state)
+        if not fields:
+            if self.docStore.compacting():
+                self.stats["segments_compacted"] += self.docStore.compact_step()
+            return 0
+
+        field = fields[0]
+        job = state["fields"][field]
+
+        # Reclassified back to SQL in the meantime: its SQL values are current again.
+        # The join fields are never cleared, whatever an older state file says.
+        if field in MANDATORY_BOTH or self.decisions.get(field) != "MONGO":
+            self._finish(state, field, "cancelled")
+            return 0
+
+        rows = self.sqlStore.scan_column(field, job["last_row_id"], self.chunkSize, JOIN_FIELDS)
+        if not rows:
+            self._finish(state, field, "done")
+            return 0
+
+        self.docStore.upsert([values for _, values in rows])
+        rowIds = [rowId for rowId, _ in rows]
+        self.sqlStore.clear_values(field, rowIds)
+
+        job["status"] = "running"
+        job["last_row_id"] = rowIds[-1]
+        job["moved"] += len(rows)
+        self._save(field, job)
+
+        self.stats["chunks"] += 1
+        self.stats["rows_moved"] += len(rows)
+        return len(rows)
+
+    def run(self):
+        """Runs every pending migration to completion, sleeping between chunks to stay under rowsPerSecond."""
+        while self.busy():
+            started = time.time()
+            moved = self.step()
+            if moved and self.rowsPerSecond:
+                remaining = moved / self.rowsPerSecond - (time.time() - started)
+                if remaining > 0:
+                    time.sleep(remaining)
+        return self.stats
+
+
+def run_migrations(chunk_size=500, rows_per_second=None):
+    sqlStore, docStore = openRecordStores()
+    engine = MigrationEngine(sqlStore, docStore, chunk_size, rows_per_second)
+    fields = engine.pending()
+    if not engine.busy():
+        print("No pending migrations.")
+        return engine.stats
+
+    if fields:
+        print(f"Migrating {len(fields)} field(s) to MONGO: {', '.join(fields)}")
+    stats = engine.run()
+    print(f"Moved {stats['rows_moved']} values in {stats['chunks']} chunks, "
+          f"rewrote {stats['segments_compacted']} segment(s).")
+    return stats
@@ -3,21 +3,108 @@ Field Normalizer module
 
 - Cleans all field names into snakecase, for uniformity throughout
 - Checks if the field name is similar to somehting seen earlier. if yes, maps it to the same field
+- Remembers every raw key it has resolved (bounded LRU), and can persist that mapping between runs
+- Fuzzy lookups only score the master keys a bigram/length index says could reach the cutoff
+- Caches (parent path, raw key) -> flattened path, so a known record flattens with one dict lookup per key
 
 """
 
 import re
 import os
-import json
+from collections import OrderedDict, defaultdict
 from difflib import get_close_matches
+from serialization import load, dump, record_path, iter_records, read_records, write_records
+
+CACHE_FILE = "data/normalizer_cache.json"
+
+def _bigrams(key):
+    counts = defaultdict(int)
+    for i in range(len(key) - 1):
+        counts[key[i:i + 2]] += 1
+    return counts
+
+class KeyIndex:
+    """
+    Candidate filter in front of get_close_matches for large vocabularies.
+
+    SequenceMatcher.ratio() is 2M/T, where M is the number of characters in the matching blocks
+    and T = len(a) + len(b). A ratio of at least c therefore needs:
+    - lengths close enough that 2 * min(len) / T >= c (length buckets);
+    - at least T * (1.5c - 1) - 1 shared bigrams. A block of k chars shares k - 1 bigrams,
+      and consecutive blocks are separated by unmatched chars, of which there are T - 2M.
+    Both are necessary conditions, so the candidates always include every key that get_close_matches
+    would accept, and running it on the candidates returns exactly the same match.
+    """
+
+    def __init__(self, cutoff):
+        self.cutoff = cutoff
+        self.by_length = defaultdict(list)
+        self.postings = defaultdict(dict)   # bigram -> {key: occurrences}
+
+    def add(self, key):
+        self.by_length[len(key)].append(key)
+        for gram, count in _bigrams(key).items():
+            self.postings[gram][key] = count
+
+    def _length_ok(self, la, lb):
+        return 2 * min(la, lb) / (la + lb) >= self.cutoff - 1e-9
+
+    def _min_shared(self, la, lb):
+        return (la + lb) * (1.5 * self.cutoff - 1) - 1 - 1e-9
+
+    def candidates(self, word):
+        la = len(word)
+        lengths = [lb for lb in self.by_length if self._length_ok(la, lb)]
+
+        shared = defaultdict(int)
+        for gram, count in _bigrams(word).items():
+            for key, key_count in self.postings.get(gram, {}).items():
+                shared[key] += min(count, key_count)
+
+        result = []
+        for lb in lengths:
+            if self._min_shared(la, lb) <= 0:
+                # Too short for the bigram bound to rule anything out
+                result.extend(self.by_length[lb])
+        for key, count in shared.items():
+            lb = len(key)
+            if self._min_shared(la, lb) > 0 and self._length_ok(la, lb) and count >= self._min_shared(la, lb):
+                result.append(key)
+        return result
 
 class DynamicNormalizer:
 
-    def __init__(self, similarity_threshold = 0.85):
+    def __init__(self, similarity_threshold = 0.85, cache_size = 4096, path_cache_size = 4096):
         self.master_keys = []
         self.threshold = similarity_threshold
+        self.index = KeyIndex(similarity_threshold)
+
+        # raw key -> canonical key, most recently used last
+        self.cache_size = cache_size
+        self.key_cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        # (parent path, raw key) -> full flattened path; once resolved a path never changes
+        self.path_cache_size = path_cache_size
+        self.path_cache = {}
 
     def normalize_key(self, key):
+        canonical = self.key_cache.get(key)
+        if canonical is not None:
+            self.key_cache.move_to_end(key)
+            self.cache_hits += 1
+            return canonical
+
+        self.cache_misses += 1
+        canonical = self._resolve_key(key)
+        if self.cache_size:
+            self.key_cache[key] = canonical
+            if len(self.key_cache) > self.cache_size:
+                self.key_cache.popitem(last=False)
+        return canonical
+
+    def _resolve_key(self, key):
 
         # 1. Handle camelCase and PascalCase (e.g., userName -> user_name)
         temp = re.sub('([a-z0-9])([A-Z])', r'\1_\2', key)
@@ -25,15 +112,66 @@ class DynamicNormalizer:
         clean_key = temp.lower().replace(" ", "_")
 
         #Dynamic discovery
-        matches = get_close_matches(clean_key, self.master_keys, n = 1, cutoff=self.threshold)
+        candidates = self.index.candidates(clean_key)
+        matches = get_close_matches(clean_key, candidates, n = 1, cutoff=self.threshold)
         if matches:
             # If a similar key exists, use the existing one
             return matches[0]
         else:
             # If it's truly new, learn it and add to master keys
-            self.master_keys.append(clean_key)
+            self._learn_key(clean_key)
             return clean_key
+
+    def _learn_key(self, key):
+        self.master_keys.append(key)
+        self.index.add(key)
+
+    def save_cache(self, path = CACHE_FILE):
+        """Persists the learned vocabulary and the raw -> canonical mapping for the next run."""
+        state = {
+            "threshold": self.threshold,
+            "master_keys": self.master_keys,
+            "key_cache": dict(self.key_cache),
+            "path_cache": [[prefix, key, path] for (prefix, key), path in self.path_cache.items()]
+        }
+        dump(state, path, atomic=True)
+
+    def load_cache(self, path = CACHE_FILE):
+        """Warm-starts from a previous run. Returns False when there is nothing to load."""
+        if not os.path.exists(path):
+            return False
+
+        state = load(path)
+
+        self.master_keys = []
+        self.index = KeyIndex(self.threshold)
+        for key in state.get("master_keys", []):
+            self._learn_key(key)
+        # Mappings resolved under a different cutoff are not valid for this one
+        if state.get("threshold") == self.threshold and self.cache_size:
+            saved = list(state.get("key_cache", {}).items())
+            self.key_cache = OrderedDict(saved[-self.cache_size:])
+        if state.get("threshold") == self.threshold and self.path_cache_size:
+            saved = state.get("path_cache", [])[-self.path_cache_size:]
+            self.path_cache = {(prefix, key): path for prefix, key, path in saved}
+        return True
     
+    def _path(self, prefix, key):
+        cache_key = (prefix, key)
+        path = self.path_cache.get(cache_key)
+        if path is not None:
+            return path
+
+        # Clean and fuzzy match the key, then build the full path (e.g. "metadata.version")
+        clean_k = self.normalize_key(key)
+        path = f"{prefix}.{clean_k}" if prefix else clean_k
+        if self.path_cache_size:
+            if len(self.path_cache) >= self.path_cache_size:
+                # Oldest entry first (dicts keep insertion order)
+                del self.path_cache[next(iter(self.path_cache))]
+            self.path_cache[cache_key] = path
+        return path
+
     def normalize_record(self, record, prefix=""):
         """
         Recursively flattens the record into dot-notation paths.
@@ -43,47 +181,54 @@ class DynamicNormalizer:
             return record
 
         flattened = {}
+        self._flatten_into(record, prefix, flattened)
+        return flattened
+
+    def _flatten_into(self, record, prefix, flattened):
+        # Nested objects write straight into the caller's dict, so a record is flattened in one pass
         for k, v in record.items():
-            # 1. Clean and Fuzzy Match the key
-            clean_k = self.normalize_key(k)
-            
-            # 2. Construct the full path (e.g., "metadata.version")
-            path = f"{prefix}.{clean_k}" if prefix else clean_k
+            path = self._path(prefix, k)
 
             if isinstance(v, dict):
                 # RECURSION: Flatten the inner dictionary
-                flattened.update(self.normalize_record(v, prefix=path))
-            elif isinstance(v, list):
-                # Handle Arrays: Mark them so the classifier knows they are complex
-                # We store the list but the Classifier will see 'isArray=True'
-                flattened[path] = v
+                self._flatten_into(v, path, flattened)
             else:
-                # LEAF NODE: Store the actual value
+                # LEAF NODE (or array): store the value. The Classifier sees lists as 'isArray=True'
                 flattened[path] = v
-                
-        return flattened
 
-def run_field_normalization():
+def run_field_normalization(stream = False):
+    """
+    stream=True reads raw records one at a time (JSON array or NDJSON) and writes each flattened
+    record straight to the output file, so memory stays flat regardless of the input size
+    (except for Parquet output, which lays out its columns from all records at once).
+    The output format follows RECORD_FORMAT (see serialization.py).
+    """
     INPUT_FILE = "data/raw_data.json"
-    OUTPUT_FILE = "data/normalized_data.json"
+    OUTPUT_FILE = record_path("data/normalized_data")
 
     if os.path.exists(INPUT_FILE):
-        with open(INPUT_FILE, 'r') as f:
-            raw_data = json.load(f)
-        
         normalizer = DynamicNormalizer()
-        
-        # Process all records
-        normalized_data = [normalizer.normalize_record(doc) for doc in raw_data]
+        normalizer.load_cache(CACHE_FILE)
         
         # Ensure data directory exists
         os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
-        
-        with open(OUTPUT_FILE, 'w') as f:
-            json.dump(normalized_data, f, indent=4)
+
+        if stream:
+            record_count = write_records((normalizer.normalize_record(doc) for doc in iter_records(INPUT_FILE)),
+                                         OUTPUT_FILE)
+        else:
+            raw_data = read_records(INPUT_FILE)
+            
+            # Process all records
+            normalized_data = [normalizer.normalize_record(doc) for doc in raw_data]
+            
+            record_count = write_records(normalized_data, OUTPUT_FILE)
+
+        normalizer.save_cache(CACHE_FILE)
             
-        print(f"Normalization complete. Saved {len(normalized_data)} records to {OUTPUT_FILE}")
+        print(f"Normalization complete. Saved {record_count} records to {OUTPUT_FILE}")
         print(f"Discovered Master Keys: {normalizer.master_keys}")
+        print(f"Key cache: {normalizer.cache_hits} hits, {normalizer.cache_misses} fuzzy lookups")
     else:
         print(f"No raw data found at {INPUT_FILE}. Run client.py first.")
 
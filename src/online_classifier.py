@@ -0,0 +1,175 @@
+"""
+Online Classifier module
+
+- Keeps rolling FieldStats for every classified field while the router runs, with exponentially decayed counters
+- Re-scores the fields with SchemaClassifier.classifyField once per window of records
+- Hysteresis: a new decision must hold with the density/cardinality limits shifted against it, for several windows in a row
+- Lets fields that became dense and type-stable move back to SQL without a full re-initialise
+
+"""
+
+from collections import defaultdict
+
+from classifier import FieldStats, SchemaClassifier, WEIGHTS, THRESHOLDS, MONGO_SCORE_THRESHOLD, MANDATORY_BOTH
+from router_logger import applyMetadataUpdates, getValType
+from sketches import HyperLogLog
+
+
+class FieldWindow:
+    """Counters for one field: the current window plus the decayed history of all earlier windows."""
+
+    def __init__(self):
+        self.present = 0
+        self.types = defaultdict(int)
+        self.nested = False
+        self.array = False
+        self.distinct = HyperLogLog(precision=8)
+
+        self.decayedPresent = 0.0
+        self.decayedTypes = defaultdict(float)
+        self.cardinality = None
+
+        self.streak = 0
+        self.proposal = None
+
+
+class OnlineClassifier:
+    """
+    Per record, observe() touches only the fields of that record, so the cost per record is constant.
+    Every `window` records, rescore() folds the window into the decayed counters
+    (history * decay + window), so a window from n rescores ago weighs decay^n, and then re-runs
+    classifyField on every field.
+
+    Hysteresis: an SQL field is scored with the density and cardinality limits lowered by `band`
+    (relative), so it must be clearly sparse / repetitive to leave; a MONGO field is scored with
+    them raised by `band`, so it must be clearly dense / distinct to come back. The new decision
+    must also win `confirmWindows` rescores in a row. Mandatory BOTH fields are never changed.
+    """
+
+    def __init__(self, plan, window=1000, decay=0.8, band=0.1, confirmWindows=3, minSupport=50.0,
+                 weights=WEIGHTS, limits=THRESHOLDS, threshold=MONGO_SCORE_THRESHOLD):
+        self.plan = plan
+        self.toMongo = SchemaClassifier(weights, self._shiftLimits(limits, 1 - band), threshold)
+        self.toSql = SchemaClassifier(weights, self._shiftLimits(limits, 1 + band), threshold)
+        self.window = window
+        self.decay = decay
+        self.confirmWindows = confirmWindows
+        self.minSupport = minSupport
+
+        self.fields = {}
+        self.windowRecords = 0
+        self.decayedRecords = 0.0
+        self.stats = {"rescores": 0, "to_sql": 0, "to_mongo": 0, "fields_updated": 0}
+
+    @staticmethod
+    def _shiftLimits(limits, factor):
+        # The stability hard gate is left alone: it already sits next to 1.0
+        shifted = dict(limits)
+        shifted["densityLimit"] = limits["densityLimit"] * factor
+        shifted["cardinalityLimit"] = limits["cardinalityLimit"] * factor
+        return shifted
+
+    def observe(self, record):
+        fields = self.fields
+        known = self.plan.schemaMap
+        for field, value in record.items():
+            if field not in known or field in MANDATORY_BOTH:
+                continue
+            state = fields.get(field)
+            if state is None:
+                state = fields[field] = FieldWindow()
+
+            state.present += 1
+            state.types[getValType(value)] += 1
+            if isinstance(value, dict):
+                state.nested = True
+            elif isinstance(value, list):
+                state.array = True
+            state.distinct.add(str(value))
+
+        self.windowRecords += 1
+        if self.windowRecords >= self.window:
+            self.rescore()
+
+    def _fold(self, state):
+        decay = self.decay
+        state.decayedPresent = state.decayedPresent * decay + state.present
+        for typeName in list(state.decayedTypes):
+            state.decayedTypes[typeName] *= decay
+        for typeName, count in state.types.items():
+            state.decayedTypes[typeName] += count
+
+        # Distinct values per appearance in this window, smoothed the same way as the counters
+        if state.present:
+            windowCardinality = min(state.distinct.count() / state.present, 1.0)
+            if state.cardinality is None:
+                state.cardinality = windowCardinality
+            else:
+                state.cardinality = state.cardinality * decay + windowCardinality * (1 - decay)
+
+        state.present = 0
+        state.types = defaultdict(int)
+        state.distinct = HyperLogLog(precision=8)
+
+    def _fieldStats(self, field, state):
+        typeCounts = state.decayedTypes
+        dominantType, dominantCount = max(typeCounts.items(), key=lambda x: x[1])
+        return FieldStats(
+            fieldName=field,
+            frequency=min(state.decayedPresent / self.decayedRecords, 1.0),
+            dominantType=dominantType,
+            typeStability=dominantCount / sum(typeCounts.values()),
+            cardinality=state.cardinality if state.cardinality is not None else 1.0,
+            isNested=state.nested,
+            isArray=state.array,
+        )
+
+    def rescore(self):
+        """Folds the finished window into the history and applies the decisions that stayed stable."""
+        self.decayedRecords = self.decayedRecords * self.decay + self.windowRecords
+        self.windowRecords = 0
+        self.stats["rescores"] += 1
+
+        updates = {}
+        for field, state in self.fields.items():
+            self._fold(state)
+            if state.decayedPresent < self.minSupport or not state.decayedTypes:
+                continue
+
+            current = self.plan.schemaMap.get(field)
+            if current not in ("SQL", "MONGO"):
+                continue
+
+            fieldStats = self._fieldStats(field, state)
+            classifier = self.toMongo if current == "SQL" else self.toSql
+            result = classifier.classifyField(fieldStats)
+            proposal = result["decision"]
+
+            if proposal == current:
+                state.streak = 0
+                state.proposal = None
+                continue
+
+            state.streak = state.streak + 1 if state.proposal == proposal else 1
+            state.proposal = proposal
+            if state.streak < self.confirmWindows:
+                continue
+
+            state.streak = 0
+            state.proposal = None
+            if proposal == "SQL":
+                # Drift checks should follow the type the field settled on
+                self.plan.analyzedSchema[field] = fieldStats.dominantType
+                self.stats["to_sql"] += 1
+            else:
+                self.stats["to_mongo"] += 1
+            self.plan.setDecision(field, proposal)
+            updates[field] = (proposal, f"Online: {result['reason']} (score {result['score']})")
+
+        if updates:
+            self.stats["fields_updated"] += applyMetadataUpdates(updates, flag="ONLINE_RECLASSIFIED")
+        return updates
+
+    def summary(self):
+        return (f"Online classifier: {self.stats['rescores']} rescores, {self.stats['to_sql']} fields to SQL, "
+                f"{self.stats['to_mongo']} fields to MONGO")
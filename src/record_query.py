@@ -0,0 +1,123 @@
+"""
+Record Query module
+
+- Reads whole records back after route_record split them into a SQL half and a document half
+- Looks up by user, by ingest time, or by a time range, through the join-key indexes of both stores
+- Both stores return matches ordered by the queried field; a merge join pairs the halves lazily,
+  also within a run of equal values, where both sides are in insertion order
+- Halves are matched on username + sys_ingested_time, the identity every record carries on both sides
+
+"""
+
+from collections import deque
+from itertools import groupby
+
+IDENTITY = ("username", "sys_ingested_time")
+
+
+def _identity(half):
+    return tuple(half.get(field) for field in IDENTITY)
+
+
+def _groups(halves, field):
+    """(value, [halves]) runs of equal field values from a stream ordered by that field."""
+    return groupby(halves, key=lambda half: half.get(field))
+
+
+def _take(waiting, identity):
+    """The oldest waiting half with this identity, or None."""
+    halves = waiting.get(identity)
+    if not halves:
+        return None
+    half = halves.popleft()
+    if not halves:
+        del waiting[identity]
+    return half
+
+
+def _join_group(sql_halves, doc_halves):
+    """
+    Pairs the halves of one group as both sides stream. Both hold the group in insertion order, so
+    partners usually arrive together; a half whose partner has not shown up yet waits, keyed by
+    identity. Only those halves are held in memory. A half left without a partner is still a
+    (partial) record.
+    """
+    sql_halves, doc_halves = iter(sql_halves), iter(doc_halves)
+    sql_waiting, doc_waiting = {}, {}
+
+    while True:
+        sql_half = next(sql_halves, None)
+        doc_half = next(doc_halves, None)
+        if sql_half is None and doc_half is None:
+            break
+
+        # Partners with the same identity pair up in arrival order, as in the stores
+        if sql_half is not None:
+            identity = _identity(sql_half)
+            partner = _take(doc_waiting, identity)
+            if partner is not None:
+                yield {**sql_half, **partner}
+            else:
+                sql_waiting.setdefault(identity, deque()).append(sql_half)
+        if doc_half is not None:
+            identity = _identity(doc_half)
+            partner = _take(sql_waiting, identity)
+            if partner is not None:
+                yield {**partner, **doc_half}
+            else:
+                doc_waiting.setdefault(identity, deque()).append(doc_half)
+
+    for waiting in (sql_waiting, doc_waiting):
+        for halves in waiting.values():
+            for half in halves:
+                yield dict(half)
+
+
+def _sort_key(value):
+    # Numbers order before strings on both stores
+    return (0, value) if isinstance(value, (int, float)) else (1, value)
+
+
+def merge_join(sql_halves, doc_halves, field):
+    """
+    Joins two streams that are both ordered by `field`. Groups of equal field values are paired
+    as they stream too, so results stream even for large ranges and large groups.
+    """
+    sql_groups = _groups(sql_halves, field)
+    doc_groups = _groups(doc_halves, field)
+    sql_next = next(sql_groups, None)
+    doc_next = next(doc_groups, None)
+
+    while sql_next is not None or doc_next is not None:
+        if doc_next is None or (sql_next is not None and _sort_key(sql_next[0]) < _sort_key(doc_next[0])):
+            yield from _join_group(sql_next[1], ())
+            sql_next = next(sql_groups, None)
+        elif sql_next is None or _sort_key(doc_next[0]) < _sort_key(sql_next[0]):
+            yield from _join_group((), doc_next[1])
+            doc_next = next(doc_groups, None)
+        else:
+            yield from _join_group(sql_next[1], doc_next[1])
+            sql_next = next(sql_groups, None)
+            doc_next = next(doc_groups, None)
+
+
+class RecordQuery:
+    def __init__(self, sql_store, doc_store):
+        self.sql_store = sql_store
+        self.doc_store = doc_store
+
+    def by_range(self, field, low, high):
+        """Whole records whose join field lies in [low, high], in field order, streamed lazily."""
+        return merge_join(self.sql_store.find_range(field, low, high),
+                          self.doc_store.find_range(field, low, high, ordered=True),
+                          field)
+
+    def by_user(self, username):
+        return self.by_range("username", username, username)
+
+    def by_ingest_time(self, ingest_time):
+        return self.by_range("sys_ingested_time", ingest_time, ingest_time)
+
+    def by_time_range(self, start, end, field="sys_ingested_time"):
+        """ISO timestamps compare as strings, so a time range is a key range; field may also be 'timestamp'."""
+        return self.by_range(field, start, end)
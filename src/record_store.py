@@ -0,0 +1,137 @@
+"""
+Record Store module
+
+- Append-only storage for routed records, written as newline-delimited JSON segments
+- Segments rotate once they pass a size or record limit, and a small manifest tracks them
+- Appending a batch only touches the active segment and the manifest, never the stored history
+- The manifest is the commit point: lines a crash wrote after its last save are never read, and cut off by the next append
+
+"""
+
+import os
+
+from serialization import load, dump, dumpb, loads
+
+MANIFEST_NAME = "manifest.json"
+
+
+class RecordStore:
+    def __init__(self, directory, max_segment_bytes=8 * 1024 * 1024, max_segment_records=50000):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_records = max_segment_records
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            return load(self.manifest_path)
+        return self._get_empty_manifest()
+
+    def _get_empty_manifest(self):
+        return {
+            "total_records": 0,
+            "segments": []
+        }
+
+    def _save_manifest(self):
+        # Write-then-rename so a crash never leaves a half-written manifest behind
+        dump(self.manifest, self.manifest_path, atomic=True)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, segment["file"])
+
+    def _is_full(self, segment):
+        return (segment["bytes"] >= self.max_segment_bytes
+                or segment["records"] >= self.max_segment_records)
+
+    def _new_segment(self):
+        segment_id = len(self.manifest["segments"]) + 1
+        segment = {
+            "file": f"segment_{segment_id:06d}.ndjson",
+            "records": 0,
+            "bytes": 0
+        }
+        self.manifest["segments"].append(segment)
+        return segment
+
+    def _active_segment(self):
+        segments = self.manifest["segments"]
+        if segments and not self._is_full(segments[-1]):
+            return segments[-1]
+        return self._new_segment()
+
+    def append(self, records):
+        """Appends a batch of records, rotating to a new segment whenever the active one fills up."""
+        if not records:
+            return 0
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        segment = self._active_segment()
+        f = self._open_segment(segment)
+        try:
+            for record in records:
+                if self._is_full(segment):
+                    f.close()
+                    segment = self._new_segment()
+                    f = self._open_segment(segment)
+
+                line = dumpb(record) + b"\n"
+                offset = f.tell()
+                f.write(line)
+                self._written(segment, offset, record)
+                segment["records"] += 1
+                segment["bytes"] = offset + len(line)
+        finally:
+            f.close()
+
+        self.manifest["total_records"] += len(records)
+        self._save_manifest()
+        return len(records)
+
+    def _open_segment(self, segment):
+        """Opens a segment for appending, cutting off whatever a crash wrote after the last manifest save."""
+        f = open(self._segment_path(segment), 'ab')
+        if f.tell() > segment["bytes"]:
+            f.truncate(segment["bytes"])
+            f.seek(0, os.SEEK_END)
+        return f
+
+    def _segment_lines(self, segment, start=0):
+        """(byte offset, line) of the segment's lines from `start` on, up to the size the manifest recorded."""
+        path = self._segment_path(segment)
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if offset + len(line) > segment["bytes"]:
+                    return
+                yield offset, line
+                offset += len(line)
+
+    def _written(self, segment, offset, record):
+        """Called for every stored record with its segment and byte offset; subclasses keep indexes with it."""
+
+    def iter_records(self):
+        """Streams every stored record back in insertion order, one segment at a time."""
+        for segment in self.manifest["segments"]:
+            for _, line in self._segment_lines(segment):
+                line = line.strip()
+                if line:
+                    yield loads(line)
+
+    def count(self):
+        return self.manifest["total_records"]
+
+    def clear(self):
+        for segment in self.manifest["segments"]:
+            path = self._segment_path(segment)
+            if os.path.exists(path):
+                os.remove(path)
+
+        self.manifest = self._get_empty_manifest()
+        if os.path.exists(self.directory):
+            self._save_manifest()
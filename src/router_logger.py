@@ -1,10 +1,19 @@
 import os
 import sys
-import json
 import time
+import shutil
 import subprocess
+import threading
 import httpx
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from typing import NamedTuple, Optional
+from sql_sink import SqlSink
+from doc_sink import open_document_sink
+from log_sink import RouterLog
+from normalizer import DynamicNormalizer
+from classifier import MANDATORY_BOTH
+from serialization import load, dump, read_records, iter_records, write_records, split_records, iter_record_range
 
 # --- Paths ---
 scriptDir = os.path.dirname(os.path.abspath(__file__))
@@ -13,10 +22,25 @@ externalDir = os.path.join(scriptDir, '..', 'external')
 
 classificationFile = os.path.join(dataDir, 'field_metadata.json')
 analyzedFile = os.path.join(dataDir, 'analyzed_data.json')
-sqlOutputFile = os.path.join(dataDir, 'sql_records.json')
-mongoOutputFile = os.path.join(dataDir, 'mongo_records.json')
-routerLogFile = os.path.join(dataDir, 'router_logger.txt')
+sqlDatabaseFile = os.path.join(dataDir, 'sql_records.db')
+mongoOutputDir = os.path.join(dataDir, 'mongo_records')
+routerLogFile = os.path.join(dataDir, 'router_logger.jsonl')
 driftLogFile = os.path.join(dataDir, 'drift_logger.txt')
+migrationsFile = os.path.join(dataDir, 'migrations.json')
+normalizerCacheFile = os.path.join(dataDir, 'normalizer_cache.json')
+backfillStagingDir = os.path.join(dataDir, 'backfill_parts')
+
+# field | record | batch | off  (see log_sink.LEVELS)
+routerLogLevel = os.environ.get("ROUTER_LOG_LEVEL", "field")
+
+# Unset: embedded file-backed document store in data/mongo_records.
+# Otherwise a MongoDB URI (needs pymongo), or 'mongomock://' (needs mongomock).
+docStoreUri = os.environ.get("DOC_STORE_URI")
+
+serverBaseUrl = "http://127.0.0.1:8000"
+
+# migrations.json is read, changed and saved by the router thread and by the service's migration steps
+migrationsLock = threading.RLock()
 
 def loadClassificationMap():
     """Loads the rules generated by your classifier."""
@@ -25,8 +49,7 @@ def loadClassificationMap():
         print("Run 'python main.py initialise' first.")
         sys.exit(1)
 
-    with open(classificationFile, 'r') as f:
-        results = json.load(f)
+    results = load(classificationFile)
     
     return {item['fieldName']: item['decision'] for item in results}
 
@@ -35,8 +58,7 @@ def loadAnalyzedSchema():
     if not os.path.exists(analyzedFile):
         return {}
     
-    with open(analyzedFile, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = load(analyzedFile)
     
     return { item['field_name']: item['dominant_type'] for item in data.get('fields', []) }
 
@@ -51,202 +73,438 @@ def getValType(val):
     if isinstance(val, dict): return "object"
     return "unknown"
 
+# Exact Python type for each schema type string. Looked up with `type(value) is ...`,
+# so a bool never passes as an integer (matching getValType).
+PY_TYPES = {
+    "null": type(None),
+    "boolean": bool,
+    "integer": int,
+    "float": float,
+    "string": str,
+    "array": list,
+    "object": dict,
+}
+
+class RouteSlot(NamedTuple):
+    toSql: bool
+    toMongo: bool
+    expectedType: Optional[type]   # None when the field is not drift-checked
+    decision: str
+
+class RoutingPlan:
+    """
+    Classification and expected types compiled once into one slot per known field,
+    so routing a value is a dict lookup plus a single type check.
+    The plan's normalizer flattens raw records into the same paths the rules were learned on.
+    """
+    def __init__(self, schemaMap, analyzedSchema, drift=None, normalizer=None):
+        self.schemaMap = schemaMap
+        self.analyzedSchema = analyzedSchema
+        self.drift = drift if drift is not None else DriftBuffer()
+        self.normalizer = normalizer
+        self.slots = {field: self._compileSlot(field) for field in schemaMap}
+
+    def _compileSlot(self, field):
+        decision = self.schemaMap[field]
+        expectedName = self.analyzedSchema.get(field)
+
+        # Drift only matters while a field still goes to SQL (or BOTH).
+        # The mandatory fields join the two stores, so they are never flipped to MONGO.
+        # Any dominant type outside PY_TYPES is a string pattern mask from the analyzer.
+        expectedType = None
+        if expectedName and decision != "MONGO" and field not in MANDATORY_BOTH:
+            expectedType = PY_TYPES.get(expectedName, str)
+
+        return RouteSlot(decision in ("SQL", "BOTH"), decision in ("MONGO", "BOTH"), expectedType, decision)
+
+    def setDecision(self, field, decision):
+        self.schemaMap[field] = decision
+        self.slots[field] = self._compileSlot(field)
+
+    def markDrift(self, field, value, ingestTime):
+        """Moves a drifted field to MONGO in memory right away; persisting it is left to the drift buffer."""
+        self.drift.add(field, self.analyzedSchema[field], getValType(value), ingestTime)
+        self.setDecision(field, "MONGO")
+        return self.slots[field]
+
+    def normalize(self, record):
+        """Raw record -> flattened record; records are passed through when the plan has no normalizer."""
+        if self.normalizer is None:
+            return record
+        return self.normalizer.normalize_record(record)
+
+    def saveNormalizer(self):
+        """Keeps the keys and paths learned on the live path for the next run (and the next training)."""
+        if self.normalizer is not None:
+            self.normalizer.save_cache(normalizerCacheFile)
+
+def loadLiveNormalizer():
+    """A normalizer warm-started from the training vocabulary, key cache and path cache."""
+    normalizer = DynamicNormalizer()
+    normalizer.load_cache(normalizerCacheFile)
+    return normalizer
+
+def loadRoutingPlan():
+    return RoutingPlan(loadClassificationMap(), loadAnalyzedSchema(), normalizer=loadLiveNormalizer())
+
+def isServerUp():
+    """Single non-blocking probe of the generator, used to reuse an already running server."""
+    try:
+        with httpx.Client() as client:
+            return client.get(f"{serverBaseUrl}/").status_code == 200
+    except (httpx.RequestError, httpx.ConnectError):
+        return False
+
 def waitForServer(url: str, timeout: int = 15):
     startTime = time.time()
     while time.time() - startTime < timeout:
         try:
             with httpx.Client() as client:
-                response = client.get("http://127.0.0.1:8000/")
+                response = client.get(f"{serverBaseUrl}/")
                 if response.status_code == 200:
                     return True
         except (httpx.RequestError, httpx.ConnectError):
             time.sleep(1)
     return False
 
-def appendJsonRecords(filepath, newRecords):
-    """Safely appends new records to an existing JSON list file."""
-    if os.path.exists(filepath):
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if not isinstance(data, list):
-                    data = []
-        except:
-            data = []
-    else:
-        data = []
-    
-    data.extend(newRecords)
-    
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2)
+def startGeneratorServer():
+    """Spawns the data generator unless one is already listening. Returns the process we own, or None."""
+    if isServerUp():
+        return None
 
-def update_metadata_file(field_name, new_decision, reason):
-    """Updates field_metadata.json with the new decision to handle drift persistently."""
-    if not os.path.exists(classificationFile):
-        return
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "simulation_code:app", "--port", "8000"],
+        cwd=externalDir,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+def stopGeneratorServer(serverProc):
+    if serverProc is not None:
+        serverProc.terminate()
+        serverProc.wait()
+
+def openRouterLog():
+    """Opens the buffered, rotating router log at the configured verbosity."""
+    return RouterLog(routerLogFile, level=routerLogLevel)
+
+def openRecordStores():
+    """Opens the relational SQL sink (schema from field_metadata.json) and the document sink."""
+    return SqlSink(sqlDatabaseFile, classificationFile, analyzedFile), open_document_sink(docStoreUri, mongoOutputDir)
+
+def applyMetadataUpdates(updates, flag="DRIFT_DETECTED"):
+    """
+    Applies {field: (decision, reason)} to field_metadata.json in one read and one atomic write,
+    tagging each changed rule with `flag`. Returns the number of rules that actually changed.
+    """
+    if not updates or not os.path.exists(classificationFile):
+        return 0
 
     try:
-        with open(classificationFile, 'r') as f:
-            rules = json.load(f)
+        rules = load(classificationFile)
         
-        updated = False
+        updated = 0
+        leftSql = []
         for rule in rules:
-            if rule['fieldName'] == field_name:
-                if rule['decision'] != new_decision:
-                    rule['decision'] = new_decision
-                    rule['reason'] = reason
-                    if "DRIFT_DETECTED" not in rule['flags']:
-                        rule['flags'].append("DRIFT_DETECTED")
-                    updated = True
-                break
+            change = updates.get(rule['fieldName'])
+            if change and rule['decision'] != change[0]:
+                if rule['fieldName'] in MANDATORY_BOTH and change[0] != "BOTH":
+                    continue
+                if rule['decision'] in ("SQL", "BOTH") and change[0] == "MONGO":
+                    leftSql.append(rule['fieldName'])
+                rule['decision'], rule['reason'] = change
+                if flag not in rule['flags']:
+                    rule['flags'].append(flag)
+                updated += 1
         
         if updated:
-            with open(classificationFile, 'w') as f:
-                json.dump(rules, f, indent=2)
+            dump(rules, classificationFile, pretty=True, atomic=True)
+        if leftSql:
+            registerMigrations(leftSql)
+        return updated
                 
     except Exception as e:
         print(f"Error updating metadata: {e}")
+        return 0
+
+def loadMigrations():
+    if not os.path.exists(migrationsFile):
+        return {"fields": {}}
+    return load(migrationsFile)
+
+def saveMigrations(state):
+    dump(state, migrationsFile, pretty=True, atomic=True)
+
+def registerMigrations(fields):
+    """Queues the stored SQL values of fields that moved to MONGO for the migration engine (migration.py)."""
+    with migrationsLock:
+        state = loadMigrations()
+        for field in fields:
+            # The join fields stay in SQL: clearing them would orphan every row's documents
+            if field in MANDATORY_BOTH:
+                continue
+            # A field that drifts again after an earlier migration starts over from the first row
+            state["fields"][field] = {
+                "status": "pending",
+                "last_row_id": 0,
+                "moved": 0,
+                "registered_at": datetime.now().isoformat()
+            }
+        saveMigrations(state)
+
+def update_metadata_file(field_name, new_decision, reason):
+    """Updates field_metadata.json with the new decision to handle drift persistently."""
+    applyMetadataUpdates({field_name: (new_decision, reason)})
+
+class DriftBuffer:
+    """
+    Holds drift events in memory, keeping only the first event per field, and writes them out
+    together: one append to drift_logger.txt and one atomic rewrite of field_metadata.json.
+    Flushed at batch boundaries, or by the next event once flushInterval seconds have passed.
+    """
+    def __init__(self, flushInterval=5.0):
+        self.flushInterval = flushInterval
+        self.pending = {}
+        self.lastFlush = time.time()
+        self.stats = {"events": 0, "coalesced": 0, "flushes": 0, "fields_updated": 0}
+
+    def add(self, field, expectedType, currentType, ingestTime):
+        self.stats["events"] += 1
+        if field in self.pending:
+            self.stats["coalesced"] += 1
+        else:
+            self.pending[field] = (expectedType, currentType, ingestTime)
+
+        if time.time() - self.lastFlush >= self.flushInterval:
+            self.flush()
+
+    def flush(self):
+        self.lastFlush = time.time()
+        if not self.pending:
+            return
+
+        pending, self.pending = self.pending, {}
+        with open(driftLogFile, 'a', encoding='utf-8') as df:
+            for field, (expectedType, currentType, ingestTime) in pending.items():
+                df.write(f"Drift detected for field '{field}' at {ingestTime}\n")
+                df.write(f"Expected: {expectedType}, Found: {currentType}. Routing to MONGO.\n\n")
+
+        updates = {field: ("MONGO", f"Drift: Expected {expectedType}, Got {currentType}")
+                   for field, (expectedType, currentType, _) in pending.items()}
+        self.stats["fields_updated"] += applyMetadataUpdates(updates)
+        self.stats["flushes"] += 1
 
-def route_record(record, schemaMap, analyzedSchema, logFile):
+    def summary(self):
+        return (f"Drift: {self.stats['events']} events, {self.stats['coalesced']} coalesced, "
+                f"{self.stats['fields_updated']} fields moved to MONGO")
+
+def route_record(record, plan, log):
     """Helper logic to route a single record, check for drift, and write to logs."""
     if 'sys_ingested_time' not in record:
         record['sys_ingested_time'] = datetime.now().isoformat()
     
     ingestTime = record['sys_ingested_time']
+    slots = plan.slots
     
     sqlDoc = {}
     mongoDoc = {}
 
-    logEntry = f"Record received at {ingestTime}\n"
-    logEntry += f"{len(record)} Fields\n"
-
     for field, value in record.items():
-        # 1. Get current decision status
-        # Default to MONGO if we've never seen this field before
-        existing_decision = schemaMap.get(field, "MONGO")
+        slot = slots.get(field)
 
-        # 2. Drift Detection
-        expectedType = analyzedSchema.get(field)
-        currentType = getValType(value)
-        
-        # Check for Drift ONLY if it's currently going to SQL (or BOTH).
-        # If it is already MONGO, we ignore type changes (Mongo-to-Mongo is safe).
-        if expectedType and currentType != expectedType and existing_decision != "MONGO":
-            
-            # A. Log the Drift
-            with open(driftLogFile, 'a', encoding='utf-8') as df:
-                df.write(f"Drift detected for field '{field}' at {ingestTime}\n")
-                df.write(f"Expected: {expectedType}, Found: {currentType}. Routing to MONGO.\n\n")
-            
-            # B. Update Metadata (Persistence)
-            update_metadata_file(field, "MONGO", f"Drift: Expected {expectedType}, Got {currentType}")
-            
-            # Update in-memory map so we don't log this again for the rest of the batch
-            schemaMap[field] = "MONGO"
-            
-            decision = "MONGO"
-        else:
-            # No drift or already Mongo
-            decision = existing_decision
+        if slot is None:
+            # Slow path: default to MONGO if we've never seen this field before
+            mongoDoc[field] = value
+            continue
 
-        logEntry += f"{field} : {decision}\n"
+        toSql, toMongo, expectedType, decision = slot
 
-        if decision == "SQL":
-            sqlDoc[field] = value
-        elif decision == "MONGO":
-            mongoDoc[field] = value
-        elif decision == "BOTH":
+        # Drift Detection: expectedType is only set for fields still headed to SQL (or BOTH).
+        # If it is already MONGO, we ignore type changes (Mongo-to-Mongo is safe).
+        if expectedType is not None and type(value) is not expectedType:
+            # Recompiles the slot so we don't report this again for the rest of the batch
+            toSql, toMongo, expectedType, decision = plan.markDrift(field, value, ingestTime)
+
+        if toSql:
             sqlDoc[field] = value
+        if toMongo:
             mongoDoc[field] = value
     
-    logEntry += "\n"
-    logFile.write(logEntry)
+    if log.records_enabled:
+        log.record(ingestTime, len(record), sqlDoc, mongoDoc)
 
     return sqlDoc, mongoDoc
 
-# --- MODE 1: Batch Processing (For Initialization) ---
-def processBatch(sourceFile: str):
-    schemaMap = loadClassificationMap()
-    analyzedSchema = loadAnalyzedSchema()
+# --- Parallel routing workers (used by processBatch when workers > 1) ---
+# Each worker reads, normalizes and routes its own range of the source file and stages the result
+# in a directory of its own: a SQLite file, a file document store and a router log part. Only drift
+# events and counts come back; the parent appends the staged parts to the stores in source order.
+_workerSchema = None
+WORKER_BATCH = 5000
+
+def _initRouteWorker(schemaMap, analyzedSchema):
+    global _workerSchema
+    _workerSchema = (schemaMap, analyzedSchema)
+
+def _routeRange(task):
+    """Routes one range of the source into its staging directory."""
+    sourceFile, start, end, stagingDir = task
+    normalizer = loadLiveNormalizer()
+    knownKeys = len(normalizer.master_keys)
+    # The parent merges and persists drift, so this buffer never flushes on its own
+    plan = RoutingPlan(dict(_workerSchema[0]), _workerSchema[1],
+                       drift=DriftBuffer(flushInterval=float("inf")), normalizer=normalizer)
+
+    sqlStore = SqlSink(os.path.join(stagingDir, "sql_records.db"), classificationFile, analyzedFile)
+    docStore = open_document_sink(None, os.path.join(stagingDir, "mongo_records"))
+    counts = {"records": 0, "sql": 0, "mongo": 0}
+    sqlDocs = []
+    mongoDocs = []
+    with RouterLog(os.path.join(stagingDir, "router_logger.jsonl"), level=routerLogLevel, max_bytes=float("inf")) as log:
+        for record in iter_record_range(sourceFile, start, end):
+            sDoc, mDoc = route_record(plan.normalize(record), plan, log)
+            if sDoc: sqlDocs.append(sDoc)
+            if mDoc: mongoDocs.append(mDoc)
+            counts["records"] += 1
+            if len(sqlDocs) >= WORKER_BATCH or len(mongoDocs) >= WORKER_BATCH:
+                counts["sql"] += sqlStore.append(sqlDocs)
+                counts["mongo"] += docStore.append(mongoDocs)
+                sqlDocs, mongoDocs = [], []
+        counts["sql"] += sqlStore.append(sqlDocs)
+        counts["mongo"] += docStore.append(mongoDocs)
+    sqlStore.close()
+
+    # First drift per field in this range, and the keys the normalizer learned on it
+    return plan.drift.pending, counts, normalizer.master_keys[knownKeys:]
+
+def routeParallel(sourceFile, plan, log, workers):
+    """
+    Routes a record file across a process pool in one pass and appends the result to the stores.
+    Each worker reads its own range of the file, so no record crosses a process boundary; the
+    staged parts are appended in source order, so row ids and segments follow the input.
+
+    A worker only knows the drift it saw itself: records of a later range may still send a field to
+    SQL after an earlier range flipped it. The first drift per field is merged here and applied
+    like a sequential run's, which queues the field's SQL values for migration, so after
+    'main.py migrate' both stores hold what a sequential run leaves. Workers normalize against the
+    warm-started vocabulary plus what they learn in their own range. Returns the routed counts.
+    """
+    shutil.rmtree(backfillStagingDir, ignore_errors=True)   # parts left by an interrupted run
+    os.makedirs(backfillStagingDir)
+
+    ranges = split_records(sourceFile, workers * 4)
+    if ranges is None:
+        # Not one record per line: stream it once into NDJSON, which splits on byte offsets
+        converted = os.path.join(backfillStagingDir, "source.ndjson")
+        write_records(iter_records(sourceFile), converted)
+        sourceFile, ranges = converted, split_records(converted, workers * 4)
+
+    tasks = [(sourceFile, start, end, os.path.join(backfillStagingDir, f"part_{part:04d}"))
+             for part, (start, end) in enumerate(ranges)]
+
+    sqlStore, mongoStore = openRecordStores()
+    totals = {"records": 0, "sql": 0, "mongo": 0}
+    drifted = set()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_initRouteWorker,
+                                 initargs=(plan.schemaMap, plan.analyzedSchema)) as pool:
+            # Parts arrive in source order and are appended while later ones are still routing
+            for task, (firstDrift, counts, learnedKeys) in zip(tasks, pool.map(_routeRange, tasks)):
+                stagingDir = task[3]
+                # The earliest range's event per field wins; later ones coalesce in the drift buffer
+                for field, (expectedType, currentType, ingestTime) in firstDrift.items():
+                    plan.drift.add(field, expectedType, currentType, ingestTime)
+                    drifted.add(field)
+                if plan.normalizer is not None:
+                    for key in learnedKeys:
+                        plan.normalizer.normalize_key(key)
+
+                sqlStore.adopt(os.path.join(stagingDir, "sql_records.db"))
+                mongoStore.adopt(os.path.join(stagingDir, "mongo_records"))
+                log.append_file(os.path.join(stagingDir, "router_logger.jsonl"))
+                shutil.rmtree(stagingDir)
+                for name in totals:
+                    totals[name] += counts[name]
+    finally:
+        sqlStore.close()
+        mongoStore.close()
+        shutil.rmtree(backfillStagingDir, ignore_errors=True)
+
+    for field in drifted:
+        plan.setDecision(field, "MONGO")
+    return totals
+
+# --- MODE 1: Batch Processing (For Initialization and Backfills) ---
+def processBatch(sourceFile: str, workers: int = 1):
+    plan = loadRoutingPlan()
     
     if not os.path.exists(sourceFile):
         print(f"Error: Source file {sourceFile} not found.")
         return
 
-    with open(sourceFile, 'r', encoding='utf-8') as f:
-        records = json.load(f)
+    with openRouterLog() as log:
+        log.batch("batch_start", source=os.path.basename(sourceFile), workers=workers)
 
-    sqlRecords = []
-    mongoRecords = []
-
-    with open(routerLogFile, 'a', encoding='utf-8') as logFile:
-        logFile.write("\n" + ("-" * 60) + "\n")
-        logFile.write(f"INITIALIZATION BATCH: Routing {len(records)} records\n")
-        logFile.write(("-" * 60) + "\n\n")
+        if workers > 1:
+            counts = routeParallel(sourceFile, plan, log, workers)
+        else:
+            # JSON array, NDJSON or Parquet, by extension
+            records = read_records(sourceFile)
+            sqlRecords = []
+            mongoRecords = []
+            for record in records:
+                sDoc, mDoc = route_record(plan.normalize(record), plan, log)
+                if sDoc: sqlRecords.append(sDoc)
+                if mDoc: mongoRecords.append(mDoc)
 
-        for record in records:
-            sDoc, mDoc = route_record(record, schemaMap, analyzedSchema, logFile)
-            if sDoc: sqlRecords.append(sDoc)
-            if mDoc: mongoRecords.append(mDoc)
+            sqlStore, mongoStore = openRecordStores()
+            sqlStore.append(sqlRecords)
+            mongoStore.append(mongoRecords)
+            counts = {"records": len(records), "sql": len(sqlRecords), "mongo": len(mongoRecords)}
 
-        logFile.write(("-" * 60) + "\n")
-        logFile.write("END OF INITIALIZATION\n")
-        logFile.write(("-" * 60) + "\n\n")
+        log.batch("batch_end", **counts, drift_events=plan.drift.stats["events"])
 
-    appendJsonRecords(sqlOutputFile, sqlRecords)
-    appendJsonRecords(mongoOutputFile, mongoRecords)
+    plan.drift.flush()
+    plan.saveNormalizer()
 
-    print(f"Batch routed: {len(sqlRecords)} SQL records, {len(mongoRecords)} Mongo records.")
+    print(f"Batch routed: {counts['sql']} SQL records, {counts['mongo']} Mongo records.")
+    print(plan.drift.summary())
     print(f"Batch logs appended to {routerLogFile}")
 
 # --- MODE 2: Stream Processing (For Router Command) ---
 def processAndSplit(recordCount: int):
-    schemaMap = loadClassificationMap()
-    analyzedSchema = loadAnalyzedSchema()
+    # Imported here because the pipeline itself builds on route_record from this module
+    from async_pipeline import run_ingest_pipeline
+
+    plan = loadRoutingPlan()
+    sqlStore, mongoStore = openRecordStores()
     
-    serverProc = subprocess.Popen(
-        [sys.executable, "-m", "uvicorn", "simulation_code:app", "--port", "8000"],
-        cwd=externalDir,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL
-    )
+    serverProc = startGeneratorServer()
 
-    url = f"http://127.0.0.1:8000/record/{recordCount}"
-    sqlRecords = []
-    mongoRecords = []
+    url = f"{serverBaseUrl}/record/{recordCount}"
+    stats = None
 
     try:
         if not waitForServer(url):
             print("Server failed to start.")
             return
 
-        with open(routerLogFile, 'a', encoding='utf-8') as logFile, httpx.stream("GET", url, timeout=None) as response:
-            count = 0
-            for line in response.iter_lines():
-                if not line.startswith("data: "):
-                    continue
-                
-                recordJson = json.loads(line[6:])
-                count += 1
-                
-                sDoc, mDoc = route_record(recordJson, schemaMap, analyzedSchema, logFile)
-                if sDoc: sqlRecords.append(sDoc)
-                if mDoc: mongoRecords.append(mDoc)
-
-                if count >= recordCount:
-                    break
+        with openRouterLog() as log:
+            log.batch("stream_start", requested=recordCount)
+            stats = run_ingest_pipeline(url, recordCount, plan, sqlStore, mongoStore, log)
+            log.batch("stream_end", **stats)
         
     except Exception as e:
         print(f"Error: {e}")
     finally:
-        serverProc.terminate()
-        serverProc.wait()
-
-    appendJsonRecords(sqlOutputFile, sqlRecords)
-    appendJsonRecords(mongoOutputFile, mongoRecords)
-
-    print(f"Appended {len(sqlRecords)} SQL records and {len(mongoRecords)} Mongo records.")
+        plan.drift.flush()
+        plan.saveNormalizer()
+        stopGeneratorServer(serverProc)
+
+    if stats:
+        print(f"Appended {stats['sql_docs']} SQL records and {stats['mongo_docs']} Mongo records "
+              f"in {stats['sql_batches'] + stats['mongo_batches']} batched writes.")
+    print(plan.drift.summary())
     print(f"Router logs appended to {routerLogFile}")
 
 if __name__ == "__main__":
@@ -0,0 +1,199 @@
+"""
+Router Service module
+
+- Resident alternative to 'main.py router N': loads the classification map once and keeps it in memory
+- Flattens each raw record with the warm-started normalizer before routing it, like the batch and stream paths
+- Holds a single long-lived streaming connection to the generator and routes records as they arrive
+- Flushes routed records to the record stores in configurable batches and tracks throughput counters
+- A timer thread flushes on the time deadline too, so a quiet stream never holds records back
+- Optionally keeps re-classifying fields online while it routes (see online_classifier.py)
+- Moves the SQL history of fields that left SQL one chunk per flush, so migrations never stall ingest
+- Store writes, migration chunks and compaction steps run outside the routing lock, so routing carries on meanwhile
+
+"""
+
+import os
+import time
+import threading
+import httpx
+from datetime import datetime
+
+from migration import MigrationEngine
+from serialization import loads, dump
+from router_logger import (
+    dataDir, serverBaseUrl,
+    loadRoutingPlan, openRecordStores, openRouterLog,
+    route_record, waitForServer, startGeneratorServer, stopGeneratorServer
+)
+
+STATS_FILE = os.path.join(dataDir, 'router_stats.json')
+
+# The generator only exposes finite streams, so we ask for a very long one and reconnect when it ends
+STREAM_CHUNK = 1_000_000
+RECONNECT_DELAY = 2.0
+
+
+class RouterService:
+    def __init__(self, batch_size=500, flush_interval=5.0, stats_interval=10.0, online=False):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats_interval = stats_interval
+
+        self.plan = loadRoutingPlan()
+        self.sqlStore, self.mongoStore = openRecordStores()
+        self.migrator = MigrationEngine(self.sqlStore, self.mongoStore, chunkSize=batch_size,
+                                        decisions=self.plan.schemaMap)
+        self.online = None
+        if online:
+            from online_classifier import OnlineClassifier
+            self.online = OnlineClassifier(self.plan)
+
+        self.sqlBuffer = []
+        self.mongoBuffer = []
+        self.pending = 0
+        self.last_flush = time.time()
+        self.last_report = time.time()
+        self.reported_count = 0
+        self.stats = self._get_empty_stats()
+
+        # The stream reader and the flush timer share the buffers, the plan and the log (lock), and
+        # the record stores (storeLock). A flush takes storeLock first, so batches land in order.
+        self.lock = threading.Lock()
+        self.storeLock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def _get_empty_stats(self):
+        return {
+            "started_at": datetime.now().isoformat(),
+            "records_routed": 0,
+            "sql_docs": 0,
+            "mongo_docs": 0,
+            "batches_flushed": 0,
+            "reconnects": 0,
+            "records_per_sec": 0.0,
+            "window_records_per_sec": 0.0
+        }
+
+    def _route(self, record, log):
+        with self.lock:
+            record = self.plan.normalize(record)
+            sDoc, mDoc = route_record(record, self.plan, log)
+            if self.online is not None:
+                self.online.observe(record)
+            if sDoc: self.sqlBuffer.append(sDoc)
+            if mDoc: self.mongoBuffer.append(mDoc)
+
+            self.pending += 1
+            self.stats["records_routed"] += 1
+
+            due = self.pending >= self.batch_size or time.time() - self.last_flush >= self.flush_interval
+        if due:
+            self.flush(log)
+
+    def _flush_timer(self, log):
+        """Flushes once the deadline passes without a record arriving to trigger it."""
+        while True:
+            remaining = self.flush_interval - (time.time() - self.last_flush)
+            if self.stopping.wait(max(remaining, 0.05)):
+                return
+            if time.time() - self.last_flush >= self.flush_interval:
+                self.flush(log)
+
+    def flush(self, log=None):
+        """
+        Persists the buffered batch to both record stores, then runs one migration step. Only taking
+        the buffers holds self.lock; the writes and the migration step hold storeLock alone.
+        """
+        with self.storeLock:
+            with self.lock:
+                sqlDocs, mongoDocs, pending = self.sqlBuffer, self.mongoBuffer, self.pending
+                self.sqlBuffer = []
+                self.mongoBuffer = []
+                self.pending = 0
+                if pending:
+                    if log is not None:
+                        log.batch("flush", records=pending, sql=len(sqlDocs), mongo=len(mongoDocs))
+                    self.stats["sql_docs"] += len(sqlDocs)
+                    self.stats["mongo_docs"] += len(mongoDocs)
+                    self.stats["batches_flushed"] += 1
+                self.plan.drift.flush()
+                self.last_flush = time.time()
+
+            if pending:
+                self.sqlStore.append(sqlDocs)
+                self.mongoStore.append(mongoDocs)
+            self.migrator.step()
+
+        with self.lock:
+            if log is not None:
+                log.flush()
+            if time.time() - self.last_report >= self.stats_interval:
+                self.report()
+
+    def report(self):
+        """Refreshes the rate counters, prints them and publishes them to router_stats.json."""
+        now = time.time()
+        started = datetime.fromisoformat(self.stats["started_at"]).timestamp()
+        window = now - self.last_report
+
+        routed = self.stats["records_routed"]
+        self.stats["records_per_sec"] = round(routed / max(now - started, 1e-9), 2)
+        self.stats["window_records_per_sec"] = round((routed - self.reported_count) / max(window, 1e-9), 2)
+        self.reported_count = routed
+        self.last_report = now
+        self.stats["drift"] = dict(self.plan.drift.stats)
+        self.stats["migration"] = dict(self.migrator.stats)
+        if self.online is not None:
+            self.stats["online"] = dict(self.online.stats)
+
+        print(f"[serve] routed={routed} sql={self.stats['sql_docs']} mongo={self.stats['mongo_docs']} "
+              f"batches={self.stats['batches_flushed']} rate={self.stats['window_records_per_sec']}/s")
+
+        dump(self.stats, STATS_FILE, pretty=True, atomic=True)
+
+    def _consume_stream(self, log):
+        url = f"{serverBaseUrl}/record/{STREAM_CHUNK}"
+        with httpx.stream("GET", url, timeout=None) as response:
+            for line in response.iter_lines():
+                if not line.startswith("data: "):
+                    continue
+                self._route(loads(line[6:]), log)
+
+    def run(self):
+        serverProc = startGeneratorServer()
+        print(f">>> Router service started (batch size {self.batch_size}, flush every {self.flush_interval}s). Ctrl+C to stop.")
+
+        try:
+            if not waitForServer(serverBaseUrl):
+                print("Server failed to start.")
+                return
+
+            with openRouterLog() as log:
+                timer = threading.Thread(target=self._flush_timer, args=(log,), daemon=True)
+                timer.start()
+                try:
+                    while True:
+                        # A stream that simply reaches its end is reopened without counting a reconnect
+                        try:
+                            self._consume_stream(log)
+                        except (httpx.RequestError, httpx.RemoteProtocolError) as e:
+                            print(f"Stream interrupted: {e}. Reconnecting...")
+                            self.stats["reconnects"] += 1
+                            time.sleep(RECONNECT_DELAY)
+                except KeyboardInterrupt:
+                    print("\n>>> Stopping router service...")
+                finally:
+                    self.stopping.set()
+                    timer.join()
+                    self.flush(log)
+                    self.plan.saveNormalizer()
+        finally:
+            stopGeneratorServer(serverProc)
+            self.report()
+            if self.online is not None:
+                print(self.online.summary())
+            print(f">>> Router service stopped. Stats written to {STATS_FILE}")
+
+
+def run_router_service(batch_size=500, flush_interval=5.0, online=False):
+    RouterService(batch_size=batch_size, flush_interval=flush_interval, online=online).run()
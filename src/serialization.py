@@ -0,0 +1,303 @@
+"""
+Serialization module
+
+- One JSON codec for the whole pipeline: orjson when it is installed, the standard library otherwise
+- Artifacts are written compact; pretty=True is kept for the small files people read by hand
+- Record files are a JSON array, NDJSON or Parquet, picked from the file extension
+- Parquet (pandas + pyarrow) is the compressed columnar option for the normalized data (RECORD_FORMAT)
+- Record files split into ranges that processes read on their own (byte offsets, or rows for Parquet)
+
+"""
+
+import os
+import re
+import json
+import math
+
+try:
+    import orjson   # optional, several times faster than the standard library
+except ImportError:
+    orjson = None
+
+CODEC = "orjson" if orjson is not None else "json"
+
+# Format of data/normalized_data.*: json (default) | ndjson | parquet
+RECORD_FORMAT = os.environ.get("RECORD_FORMAT", "json")
+EXTENSIONS = {"json": ".json", "ndjson": ".ndjson", "parquet": ".parquet"}
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+# orjson reads integers outside 64 bits back as floats; any run of 19+ digits sends a document to json
+_LONG_DIGITS = re.compile(r"\d{19,}")
+_LONG_DIGITS_BYTES = re.compile(rb"\d{19,}")
+
+
+def _has_nonfinite(obj):
+    """True if obj holds a NaN or infinite float, which orjson would write as null."""
+    if isinstance(obj, float):
+        return not math.isfinite(obj)
+    if isinstance(obj, dict):
+        return any(_has_nonfinite(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(_has_nonfinite(value) for value in obj)
+    if getattr(obj, "dtype", None) is not None and obj.dtype.kind == "f":
+        # numpy arrays and scalars
+        return not all(math.isfinite(value) for value in obj.flat)
+    return False
+
+
+def _to_builtin(obj):
+    # numpy values reach the json fallback when orjson is missing or gave up on a document
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumpb(obj, pretty=False):
+    """
+    Encodes obj as UTF-8 JSON bytes. Documents orjson cannot write faithfully fall back to json:
+    ints over 64 bits (orjson rejects them) and NaN / Infinity (orjson writes them as null).
+    """
+    if orjson is not None:
+        try:
+            data = orjson.dumps(obj, option=_OPTIONS | orjson.OPT_INDENT_2 if pretty else _OPTIONS)
+            if b"null" not in data or not _has_nonfinite(obj):
+                return data
+        except TypeError:
+            pass
+    if pretty:
+        return json.dumps(obj, indent=2, ensure_ascii=False, default=_to_builtin).encode('utf-8')
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=_to_builtin).encode('utf-8')
+
+
+def dumps(obj, pretty=False):
+    return dumpb(obj, pretty).decode('utf-8')
+
+
+def loads(data):
+    """Decodes a str or bytes JSON document, with json for what orjson rejects or would round off."""
+    if orjson is not None:
+        pattern = _LONG_DIGITS_BYTES if isinstance(data, (bytes, bytearray, memoryview)) else _LONG_DIGITS
+        if not pattern.search(data):
+            try:
+                return orjson.loads(data)
+            except ValueError:
+                # Documents orjson does not accept (NaN / Infinity written by json) get a second chance
+                pass
+    return json.loads(data)
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+def dump(obj, path, pretty=False, atomic=False):
+    """Writes obj to path; atomic=True writes a .tmp file and renames it over path."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    target = path + ".tmp" if atomic else path
+    with open(target, 'wb') as f:
+        f.write(dumpb(obj, pretty))
+        if pretty:
+            f.write(b"\n")
+    if atomic:
+        os.replace(target, path)
+
+
+# --- Record files ---
+
+def record_path(stem, fmt=None):
+    """'data/normalized_data' -> 'data/normalized_data.json' (or .ndjson / .parquet for RECORD_FORMAT)."""
+    fmt = fmt or RECORD_FORMAT
+    if fmt not in EXTENSIONS:
+        raise ValueError(f"Unknown record format '{fmt}'. Use one of {', '.join(EXTENSIONS)}.")
+    return stem + EXTENSIONS[fmt]
+
+
+def _format_of(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".parquet":
+        return "parquet"
+    if ext in (".ndjson", ".jsonl"):
+        return "ndjson"
+    return "json"
+
+
+def write_records(records, path):
+    """
+    Writes an iterable of records in the format the extension names. JSON arrays and NDJSON are
+    written one record at a time; Parquet needs every record before it can lay out the columns.
+    Returns the number of records written.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fmt = _format_of(path)
+    if fmt == "parquet":
+        return _write_parquet(list(records), path)
+
+    count = 0
+    with open(path, 'wb') as f:
+        if fmt == "json":
+            f.write(b"[")
+        for record in records:
+            if fmt == "json":
+                f.write(b"\n" if count == 0 else b",\n")
+                f.write(dumpb(record))
+            else:
+                f.write(dumpb(record) + b"\n")
+            count += 1
+        if fmt == "json":
+            f.write(b"\n]\n")
+    return count
+
+
+def iter_records(path):
+    """Yields the records of a JSON array, NDJSON or Parquet file."""
+    if _format_of(path) == "parquet":
+        yield from _read_parquet(path)
+    elif _format_of(path) == "ndjson":
+        with open(path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    yield loads(line)
+    else:
+        from json_stream import iter_json_records   # json_stream itself decodes with this module
+        yield from iter_json_records(path)
+
+
+def read_records(path):
+    if _format_of(path) == "json":
+        return load(path)
+    return list(iter_records(path))
+
+
+# --- Record ranges ---
+# A parallel backfill hands each worker a range of the source file instead of the records. NDJSON,
+# and JSON arrays laid out one record per line (as write_records writes them), split on byte
+# offsets: a record belongs to the range its line starts in. Parquet splits on row numbers.
+
+def _one_record_per_line(path):
+    with open(path, 'rb') as f:
+        if f.readline().strip() != b"[":
+            return False
+        line = f.readline().strip()
+        if line == b"]":
+            return True
+        try:
+            loads(line[:-1] if line.endswith(b",") else line)
+        except ValueError:
+            return False
+    return True
+
+
+def split_records(path, parts):
+    """
+    Up to `parts` (start, end) ranges covering the file, for iter_record_range. Returns None for
+    a JSON array that is not laid out one record per line, which cannot be split without parsing it.
+    """
+    fmt = _format_of(path)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq   # installed with the Parquet support pandas needs
+        total = pq.ParquetFile(path).metadata.num_rows
+    elif fmt == "json" and not _one_record_per_line(path):
+        return None
+    else:
+        total = os.path.getsize(path)
+    bounds = [total * i // parts for i in range(parts + 1)]
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+
+def iter_record_range(path, start, end):
+    """Yields the records of one split_records range, reading only that part of the file."""
+    if _format_of(path) == "parquet":
+        yield from _read_parquet(path, start, end)
+        return
+
+    with open(path, 'rb') as f:
+        if start > 0:
+            # The line running over the start belongs to the previous range
+            f.seek(start - 1)
+            f.readline()
+        offset = f.tell()
+        while offset < end:
+            line = f.readline()
+            if not line:
+                break
+            offset += len(line)
+            line = line.strip()
+            if line.endswith(b","):
+                line = line[:-1]
+            if line and line not in (b"[", b"]"):
+                yield loads(line)
+
+
+# --- Parquet ---
+# Each flattened field is one column. A column whose values all share one scalar type is stored
+# natively (nullable Int64 / Float64 / boolean / string), with null meaning "field absent".
+# Columns with mixed types, arrays, objects or explicit nulls are stored as JSON text, where a
+# JSON 'null' is an explicit null and a missing cell is an absent field. Records therefore read back
+# with the same fields, values and types; only the key order follows the column order.
+
+_MISSING = object()
+_NATIVE_TYPES = {bool: "boolean", int: "Int64", float: "Float64", str: "string"}
+_INT64_RANGE = (-2 ** 63, 2 ** 63 - 1)
+
+
+def _column_dtype(values):
+    types = {type(value) for value in values if value is not _MISSING}
+    if len(types) != 1:
+        return None
+    if float in types and any(v != v for v in values if v is not _MISSING):
+        return None   # NaN would read back as a missing cell
+    dtype = _NATIVE_TYPES.get(types.pop())
+    if dtype == "Int64" and not all(_INT64_RANGE[0] <= v <= _INT64_RANGE[1] for v in values if v is not _MISSING):
+        return None
+    return dtype
+
+
+def _write_parquet(records, path):
+    import pandas as pd   # pandas needs pyarrow (or fastparquet) installed to write Parquet
+
+    names = {}
+    for record in records:
+        for name in record:
+            names.setdefault(name, None)
+
+    columns = {}
+    json_columns = []
+    for name in names:
+        values = [record.get(name, _MISSING) for record in records]
+        dtype = _column_dtype(values)
+        if dtype is None:
+            json_columns.append(name)
+            columns[name] = pd.array([None if v is _MISSING else dumps(v) for v in values], dtype="string")
+        else:
+            columns[name] = pd.array([None if v is _MISSING else v for v in values], dtype=dtype)
+
+    frame = pd.DataFrame(columns, index=pd.RangeIndex(len(records)))
+    frame.attrs["json_columns"] = json_columns
+    frame.to_parquet(path, compression="zstd", index=False)
+    return len(records)
+
+
+def _read_parquet(path, start=None, end=None):
+    import pandas as pd
+
+    frame = pd.read_parquet(path)
+    json_columns = set(frame.attrs.get("json_columns", []))
+    if start is not None:
+        frame = frame.iloc[start:end]
+    columns = []
+    for name in frame.columns:
+        column = frame[name]
+        missing = column.isna().tolist()
+        values = column.to_numpy(dtype=object, na_value=None).tolist()
+        if name in json_columns:
+            values = [_MISSING if gap else loads(v) for v, gap in zip(values, missing)]
+        else:
+            # Nullable arrays may hand back numpy scalars; records carry plain Python values
+            values = [_MISSING if gap else v.item() if hasattr(v, "item") else v for v, gap in zip(values, missing)]
+        columns.append((name, values))
+
+    for i in range(len(frame)):
+        yield {name: values[i] for name, values in columns if values[i] is not _MISSING}
@@ -0,0 +1,93 @@
+"""
+Sketches module
+
+- Fixed-size, mergeable summaries used by the analyzer's sketch statistics mode
+- HyperLogLog: distinct counts in 2^precision bytes per field (~1.6% error at the default precision)
+- SpaceSaving: approximate top-k heavy hitters with a bounded number of counters
+
+"""
+
+import math
+import base64
+from hashlib import blake2b
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+
+    def add(self, value: str):
+        h = _hash64(value)
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> float:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+
+        # Small-range correction (linear counting) while many registers are still empty
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return estimate
+
+    def merge(self, other: "HyperLogLog"):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def to_state(self):
+        return {"precision": self.precision, "registers": base64.b64encode(bytes(self.registers)).decode('ascii')}
+
+    @classmethod
+    def from_state(cls, state):
+        sketch = cls(state["precision"])
+        sketch.registers = bytearray(base64.b64decode(state["registers"]))
+        return sketch
+
+
+class SpaceSaving:
+    """Keeps `capacity` counters; an unseen item replaces the smallest one and inherits its count."""
+
+    def __init__(self, k=10, capacity=None):
+        self.k = k
+        self.capacity = capacity or max(4 * k, 32)
+        self.counters = {}
+
+    def add(self, item: str):
+        if item in self.counters:
+            self.counters[item] += 1
+        elif len(self.counters) < self.capacity:
+            self.counters[item] = 1
+        else:
+            smallest = min(self.counters, key=self.counters.get)
+            self.counters[item] = self.counters.pop(smallest) + 1
+
+    def top(self):
+        return sorted(self.counters.items(), key=lambda x: (-x[1], x[0]))[:self.k]
+
+    def merge(self, other: "SpaceSaving"):
+        for item, count in other.counters.items():
+            self.counters[item] = self.counters.get(item, 0) + count
+        if len(self.counters) > self.capacity:
+            keep = sorted(self.counters.items(), key=lambda x: (-x[1], x[0]))[:self.capacity]
+            self.counters = dict(keep)
+
+    def to_state(self):
+        return {"k": self.k, "capacity": self.capacity, "counters": self.counters}
+
+    @classmethod
+    def from_state(cls, state):
+        sketch = cls(state["k"], state["capacity"])
+        sketch.counters = dict(state["counters"])
+        return sketch
@@ -0,0 +1,336 @@
+"""
+SQL Sink module
+
+- Relational store for the SQL half of routed records, with the same interface as RecordStore
+- Table DDL comes from the SQL/BOTH decisions in field_metadata.json, column types from the analyzed dominant types
+- Each batch is one executemany inside one transaction, on a connection reused from a small pool
+- Fields that start going to SQL later (new fields, reclassification) become ALTER TABLE ADD COLUMN
+- SQL specifics live in a dialect class; SQLite is the local stand-in, PostgreSQL only needs another dialect
+- The join fields shared with the document side are indexed, so lookups on them are B-tree searches
+- Fields present with a null value are listed per row, so they read back as None instead of disappearing
+- adopt() appends the table of another database file in one INSERT ... SELECT (parallel backfill parts)
+
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from classifier import MANDATORY_BOTH
+from serialization import load, dumps, loads
+
+TABLE_NAME = "records"
+ROW_ID = "_row_id"
+# JSON list of the fields a row had with a null value. A NULL column alone cannot tell "null" from
+# "absent", and a field that has only ever been null never gets a column of its own.
+NULL_FIELDS = "_null_fields"
+
+
+class SqliteDialect:
+    """
+    Everything database specific. A PostgreSQL dialect would connect with psycopg, use %s
+    placeholders, BIGSERIAL / DOUBLE PRECISION / JSONB types and read information_schema.columns.
+    """
+    placeholder = "?"
+
+    # Schema type -> declared column type. BOOLEAN and JSONTEXT are kept as declared names so
+    # values can be decoded back to bool / list / dict (their affinities are NUMERIC and TEXT).
+    TYPES = {
+        "integer": "INTEGER",
+        "float": "REAL",
+        "boolean": "BOOLEAN",
+        "string": "TEXT",
+        "object": "JSONTEXT",
+        "array": "JSONTEXT",
+    }
+
+    def connect(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Connections are handed between threads by the pool, but only one thread uses one at a time
+        # timeout: wait for another process's write (e.g. a migration chunk) instead of failing
+        conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def quote(self, name):
+        return '"' + name.replace('"', '""') + '"'
+
+    def column_type(self, schema_type):
+        # String pattern masks (e.g. 'd.d.d.d') and unknown types are stored as text
+        return self.TYPES.get(schema_type, "TEXT")
+
+    def create_table(self, table, columns):
+        defs = [f"{self.quote(ROW_ID)} INTEGER PRIMARY KEY AUTOINCREMENT"]
+        defs += [f"{self.quote(name)} {col_type}" for name, col_type in columns.items()]
+        return f"CREATE TABLE IF NOT EXISTS {self.quote(table)} ({', '.join(defs)})"
+
+    def create_index(self, table, name):
+        index = self.quote(f"idx_{table}_{name}")
+        return f"CREATE INDEX IF NOT EXISTS {index} ON {self.quote(table)} ({self.quote(name)})"
+
+    def add_column(self, table, name, col_type):
+        return f"ALTER TABLE {self.quote(table)} ADD COLUMN {self.quote(name)} {col_type}"
+
+    def existing_columns(self, conn, table, schema="main"):
+        """Returns {column: declared type} for the table, without the row id."""
+        rows = conn.execute(f"PRAGMA {self.quote(schema)}.table_info({self.quote(table)})").fetchall()
+        return {row[1]: row[2] for row in rows if row[1] != ROW_ID}
+
+    def attach(self, conn, path, schema):
+        conn.execute(f"ATTACH DATABASE {self.placeholder} AS {self.quote(schema)}", (path,))
+
+    def detach(self, conn, schema):
+        conn.execute(f"DETACH DATABASE {self.quote(schema)}")
+
+
+class ConnectionPool:
+    """A fixed number of connections, opened lazily and reused for every batch."""
+
+    def __init__(self, dialect, path, size=2):
+        self.dialect = dialect
+        self.path = path
+        self.size = size
+        self.idle = queue.Queue()
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        conn = None
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                if self.opened < self.size:
+                    conn = self.dialect.connect(self.path)
+                    self.opened += 1
+        if conn is None:
+            conn = self.idle.get()
+        try:
+            yield conn
+        finally:
+            self.idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self.opened = 0
+
+
+def _schema_type(value):
+    if isinstance(value, bool): return "boolean"
+    if isinstance(value, int): return "integer"
+    if isinstance(value, float): return "float"
+    if isinstance(value, (dict, list)): return "object"
+    return "string"
+
+
+class SqlSink:
+    def __init__(self, path, metadata_file=None, analyzed_file=None, table=TABLE_NAME,
+                 dialect=None, pool_size=2, index_fields=tuple(sorted(MANDATORY_BOTH))):
+        self.path = path
+        self.table = table
+        self.metadata_file = metadata_file
+        self.analyzed_file = analyzed_file
+        self.dialect = dialect or SqliteDialect()
+        self.pool = ConnectionPool(self.dialect, path, pool_size)
+        self.schema_lock = threading.Lock()
+        self.columns = {}
+        self.index_fields = index_fields
+        self._ensure_schema()
+
+    def _planned_columns(self):
+        """Columns for the SQL/BOTH fields in field_metadata.json, typed from analyzed_data.json."""
+        if not self.metadata_file or not os.path.exists(self.metadata_file):
+            return {}
+        rules = load(self.metadata_file)
+
+        types = {}
+        if self.analyzed_file and os.path.exists(self.analyzed_file):
+            types = {item['field_name']: item['dominant_type'] for item in load(self.analyzed_file).get('fields', [])}
+
+        # A field without an analyzed type gets its column from the first value stored (_add_columns)
+        return {rule['fieldName']: self.dialect.column_type(types[rule['fieldName']])
+                for rule in rules if rule['decision'] in ("SQL", "BOTH") and rule['fieldName'] in types}
+
+    def _ensure_schema(self):
+        planned = self._planned_columns()
+        with self.pool.connection() as conn, conn:
+            conn.execute(self.dialect.create_table(self.table, {NULL_FIELDS: "JSONTEXT", **planned}))
+            self.columns = self.dialect.existing_columns(conn, self.table)
+            # Tables created before null tracking get the column added
+            if self.columns.pop(NULL_FIELDS, None) is None:
+                conn.execute(self.dialect.add_column(self.table, NULL_FIELDS, "JSONTEXT"))
+            for name, col_type in planned.items():
+                if name not in self.columns:
+                    conn.execute(self.dialect.add_column(self.table, name, col_type))
+                    self.columns[name] = col_type
+            self._create_indexes(conn)
+
+    def _create_indexes(self, conn):
+        for name in self.index_fields:
+            if name in self.columns:
+                conn.execute(self.dialect.create_index(self.table, name))
+
+    def _add_columns(self, conn, records):
+        """ALTER TABLE for fields this batch brings that the table does not have yet (nulls need none)."""
+        for record in records:
+            for name, value in record.items():
+                if name not in self.columns and value is not None:
+                    col_type = self.dialect.column_type(_schema_type(value))
+                    conn.execute(self.dialect.add_column(self.table, name, col_type))
+                    self.columns[name] = col_type
+                    if name in self.index_fields:
+                        conn.execute(self.dialect.create_index(self.table, name))
+
+    def _encode(self, value):
+        if isinstance(value, (dict, list)):
+            return dumps(value)
+        return value
+
+    def _decode(self, col_type, value):
+        # Only values stored by _encode are converted; anything else comes back as SQLite kept it
+        if col_type == "BOOLEAN" and type(value) is int:
+            return bool(value)
+        if col_type == "JSONTEXT" and type(value) is str:
+            return loads(value)
+        return value
+
+    def append(self, records):
+        """Inserts a batch with one executemany in a single transaction."""
+        if not records:
+            return 0
+
+        with self.schema_lock, self.pool.connection() as conn, conn:
+            self._add_columns(conn, records)
+            names = list(self.columns)
+            columns = ", ".join(self.dialect.quote(name) for name in names + [NULL_FIELDS])
+            values = ", ".join([self.dialect.placeholder] * (len(names) + 1))
+            conn.executemany(
+                f"INSERT INTO {self.dialect.quote(self.table)} ({columns}) VALUES ({values})",
+                [tuple(self._encode(record.get(name)) for name in names) + (self._null_fields(record),)
+                 for record in records])
+        return len(records)
+
+    def adopt(self, path):
+        """
+        Appends every row of the same table in another database file, in its row id order, without
+        decoding them. Columns only the other table has are added first. Returns the number of rows.
+        """
+        quote = self.dialect.quote
+        with self.schema_lock, self.pool.connection() as conn:
+            self.dialect.attach(conn, path, "staged")
+            try:
+                with conn:
+                    staged = self.dialect.existing_columns(conn, self.table, schema="staged")
+                    for name, col_type in staged.items():
+                        if name not in self.columns and name != NULL_FIELDS:
+                            conn.execute(self.dialect.add_column(self.table, name, col_type))
+                            self.columns[name] = col_type
+                            if name in self.index_fields:
+                                conn.execute(self.dialect.create_index(self.table, name))
+                    columns = ", ".join(quote(name) for name in staged)
+                    cursor = conn.execute(
+                        f"INSERT INTO {quote(self.table)} ({columns}) "
+                        f"SELECT {columns} FROM {quote('staged')}.{quote(self.table)} ORDER BY {quote(ROW_ID)}")
+                    return cursor.rowcount
+            finally:
+                self.dialect.detach(conn, "staged")
+
+    def _null_fields(self, record):
+        nulls = [name for name, value in record.items() if value is None]
+        return dumps(nulls) if nulls else None
+
+    def _row_dict(self, names, row):
+        """Row -> record: NULL columns are left out unless the record had the field with a null value."""
+        record = {}
+        nulls = None
+        for name, value in zip(names, row):
+            if name == NULL_FIELDS:
+                nulls = value
+            elif value is not None and name != ROW_ID:
+                record[name] = self._decode(self.columns.get(name), value)
+        if nulls:
+            for name in loads(nulls):
+                record.setdefault(name, None)
+        return record
+
+    def _select(self, where="", params=(), order_by=ROW_ID, batch_size=1000):
+        """Streams matching rows as dicts, fetching batch_size rows at a time."""
+        quote = self.dialect.quote
+        order = quote(ROW_ID) if order_by == ROW_ID else f"{quote(order_by)}, {quote(ROW_ID)}"
+        with self.pool.connection() as conn:
+            cursor = conn.execute(f"SELECT * FROM {quote(self.table)} {where} ORDER BY {order}", params)
+            names = [d[0] for d in cursor.description]
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._row_dict(names, row)
+
+    def iter_records(self, batch_size=1000):
+        """Streams the stored rows back as dicts in insertion order."""
+        return self._select(batch_size=batch_size)
+
+    def find_range(self, field, low, high):
+        """Rows whose field lies in [low, high], ordered by that field and then insertion order."""
+        if field not in self.columns:
+            return iter(())
+        placeholder = self.dialect.placeholder
+        where = f"WHERE {self.dialect.quote(field)} BETWEEN {placeholder} AND {placeholder}"
+        return self._select(where, (low, high), order_by=field)
+
+    def find(self, field, value):
+        return self.find_range(field, value, value)
+
+    def scan_column(self, field, after_row_id, limit, with_fields=()):
+        """
+        The next `limit` rows after after_row_id that hold a value for `field`, as
+        (row id, {field and with_fields}) pairs in row id order. Used by the migration engine.
+        """
+        if field not in self.columns:
+            return []
+        quote = self.dialect.quote
+        placeholder = self.dialect.placeholder
+        names = [field] + [name for name in with_fields if name in self.columns]
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT {quote(ROW_ID)}, {', '.join(quote(name) for name in names)} FROM {quote(self.table)} "
+                f"WHERE {quote(ROW_ID)} > {placeholder} AND {quote(field)} IS NOT NULL "
+                f"ORDER BY {quote(ROW_ID)} LIMIT {int(limit)}",
+                (after_row_id,)).fetchall()
+        return [(row[0], {name: self._decode(self.columns.get(name), value)
+                          for name, value in zip(names, row[1:]) if value is not None})
+                for row in rows]
+
+    def clear_values(self, field, row_ids):
+        """Sets `field` to NULL on the given rows in one transaction."""
+        if not row_ids or field not in self.columns:
+            return 0
+        quote = self.dialect.quote
+        with self.pool.connection() as conn, conn:
+            conn.executemany(
+                f"UPDATE {quote(self.table)} SET {quote(field)} = NULL WHERE {quote(ROW_ID)} = {self.dialect.placeholder}",
+                [(row_id,) for row_id in row_ids])
+        return len(row_ids)
+
+    def count(self):
+        with self.pool.connection() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {self.dialect.quote(self.table)}").fetchone()[0]
+
+    def clear(self):
+        """Drops the table and recreates it from the current field_metadata.json."""
+        with self.schema_lock:
+            with self.pool.connection() as conn, conn:
+                conn.execute(f"DROP TABLE IF EXISTS {self.dialect.quote(self.table)}")
+            self._ensure_schema()
+
+    def close(self):
+        self.pool.close()
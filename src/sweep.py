@@ -0,0 +1,166 @@
+"""
+Sweep module
+
+- Evaluates a grid of classifier weights / limits / score thresholds against the cached analyzed_data.json
+- The analysis is loaded once and handed to each worker process once; every combination is a classifyBulk call
+- Reports SQL / MONGO / BOTH field counts and the estimated bytes each backend would store
+- Usage: python src/main.py sweep [gridFile] [workers]
+
+"""
+
+import os
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+from classifier import SchemaClassifier, WEIGHTS, THRESHOLDS, MONGO_SCORE_THRESHOLD, COST_MODEL
+from serialization import load, dump
+
+ANALYSIS_FILE = "data/analyzed_data.json"
+RESULTS_FILE = "data/sweep_results.json"
+
+# Each key is a WEIGHTS / THRESHOLDS entry or "threshold" (MONGO_SCORE_THRESHOLD).
+# Keys left out keep the value from classifier.py.
+DEFAULT_GRID = {
+    "sparsity": [1.0, 1.5, 2.0],
+    "nested": [1.5, 2.0, 3.0],
+    "lowCardinality": [0.5, 1.0],
+    "densityLimit": [0.4, 0.6, 0.8],
+    "cardinalityLimit": [0.05, 0.1, 0.2],
+    "threshold": [0.2, 0.3, 0.4],
+}
+
+# Rough stored size of one value of each type, in bytes, for analyses without measured sizes
+TYPE_BYTES = {
+    "null": 0,
+    "boolean": 1,
+    "integer": 8,
+    "float": 8,
+    "string": 24,
+    "object": 64,
+    "array": 64,
+}
+# Any other dominant type is a string pattern mask
+PATTERN_BYTES = 16
+
+
+def _valueBytes(record):
+    # Measured by the analyzer when available, otherwise a per-type estimate
+    if 'avg_size' in record:
+        return record['avg_size'] * (1 - record['null_ratio'])
+    return TYPE_BYTES.get(record['dominant_type'], PATTERN_BYTES)
+
+
+def loadColumns(path=ANALYSIS_FILE):
+    """Reads analyzed_data.json once into the column arrays classifyBulk takes, plus per-field byte estimates."""
+    data = load(path)
+
+    fields = data['fields']
+    total = data.get('total_records', 0)
+    columns = {
+        "fieldName": [record['field_name'] for record in fields],
+        "frequency": [record['frequency'] for record in fields],
+        "dominantType": [record['dominant_type'] for record in fields],
+        "typeStability": [record['type_stability'] for record in fields],
+        "cardinality": [record['cardinality'] for record in fields],
+        "isNested": [record['is_nested'] for record in fields],
+        "isArray": [record['is_array'] for record in fields],
+    }
+
+    # Bytes each field would add to either backend across the analyzed sample, priced like classifyByCost
+    sqlBytes = []
+    mongoBytes = []
+    for record in fields:
+        present = record['frequency'] * total
+        value = _valueBytes(record)
+        nameBytes = len(record['field_name'].encode('utf-8'))
+        sqlBytes.append(present * value + total * COST_MODEL["sqlColumnBytes"])
+        mongoBytes.append(present * (value + nameBytes + COST_MODEL["docFieldOverhead"]))
+    return columns, sqlBytes, mongoBytes
+
+
+def gridCombinations(grid):
+    keys = list(grid)
+    for values in itertools.product(*(grid[key] for key in keys)):
+        yield dict(zip(keys, values))
+
+
+def _configFor(params):
+    weights = {key: params.get(key, value) for key, value in WEIGHTS.items()}
+    limits = {key: params.get(key, value) for key, value in THRESHOLDS.items()}
+    return weights, limits, params.get("threshold", MONGO_SCORE_THRESHOLD)
+
+
+def evaluate(params, columns, sqlBytes, mongoBytes):
+    weights, limits, threshold = _configFor(params)
+    results = SchemaClassifier(weights, limits, threshold).classifyBulk(columns)
+
+    counts = {"SQL": 0, "MONGO": 0, "BOTH": 0}
+    bytesPerBackend = {"sql": 0.0, "mongo": 0.0}
+    for i, res in enumerate(results):
+        decision = res["decision"]
+        counts[decision] += 1
+        if decision in ("SQL", "BOTH"):
+            bytesPerBackend["sql"] += sqlBytes[i]
+        if decision in ("MONGO", "BOTH"):
+            bytesPerBackend["mongo"] += mongoBytes[i]
+
+    return {
+        "params": params,
+        "counts": counts,
+        "sql_bytes": round(bytesPerBackend["sql"]),
+        "mongo_bytes": round(bytesPerBackend["mongo"]),
+        "total_bytes": round(bytesPerBackend["sql"] + bytesPerBackend["mongo"]),
+    }
+
+
+# --- Worker processes: the analysis is sent once through the pool initializer ---
+_workerColumns = None
+
+def _initSweepWorker(columns, sqlBytes, mongoBytes):
+    global _workerColumns
+    _workerColumns = (columns, sqlBytes, mongoBytes)
+
+def _evaluateChunk(chunk):
+    return [evaluate(params, *_workerColumns) for params in chunk]
+
+
+def runSweep(grid=None, workers=None, analysisFile=ANALYSIS_FILE, resultsFile=RESULTS_FILE, top=10):
+    if not os.path.exists(analysisFile):
+        print(f"No analysis found at {analysisFile}. Run 'python main.py initialise' first.")
+        return []
+
+    grid = grid or DEFAULT_GRID
+    workers = workers or os.cpu_count() or 1
+    columns, sqlBytes, mongoBytes = loadColumns(analysisFile)
+    combos = list(gridCombinations(grid))
+    print(f"Sweeping {len(combos)} configurations over {len(columns['fieldName'])} fields with {workers} workers...")
+
+    if workers > 1:
+        chunkSize = max(1, -(-len(combos) // (workers * 4)))
+        chunks = [combos[i:i + chunkSize] for i in range(0, len(combos), chunkSize)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_initSweepWorker,
+                                 initargs=(columns, sqlBytes, mongoBytes)) as pool:
+            results = [result for chunk in pool.map(_evaluateChunk, chunks) for result in chunk]
+    else:
+        results = [evaluate(params, columns, sqlBytes, mongoBytes) for params in combos]
+
+    results.sort(key=lambda r: r["total_bytes"])
+
+    dump(results, resultsFile, pretty=True)
+
+    print(f"{'SQL':>5} {'MONGO':>5} {'BOTH':>5} {'SQL bytes':>12} {'Mongo bytes':>12}  Params")
+    print("-" * 90)
+    for res in results[:top]:
+        counts = res["counts"]
+        params = ", ".join(f"{key}={value}" for key, value in res["params"].items())
+        print(f"{counts['SQL']:>5} {counts['MONGO']:>5} {counts['BOTH']:>5} "
+              f"{res['sql_bytes']:>12} {res['mongo_bytes']:>12}  {params}")
+    print(f"\nAll {len(results)} configurations written to {resultsFile}")
+    return results
+
+
+def run_sweep(grid_file=None, workers=None):
+    grid = None
+    if grid_file:
+        grid = load(grid_file)
+    return runSweep(grid, workers)
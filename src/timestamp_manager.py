@@ -1,6 +1,6 @@
-import json
 import os
 from datetime import datetime, timezone
+from serialization import load, dump
 
 def get_current_server_time() -> str:
     return datetime.now(timezone.utc).isoformat()
@@ -12,8 +12,7 @@ class TimestampManager:
 
     def _load_state(self):
         if os.path.exists(self.storage_path):
-            with open(self.storage_path, 'r') as f:
-                return json.load(f)
+            return load(self.storage_path)
         return self._get_empty_state()
 
     def _get_empty_state(self):
@@ -59,9 +58,7 @@ class TimestampManager:
         return self.state["summary"]["last_data_point"]
 
     def _save(self):
-        os.makedirs(os.path.dirname(self.storage_path), exist_ok=True)
-        with open(self.storage_path, 'w') as f:
-            json.dump(self.state, f, indent=4)
+        dump(self.state, self.storage_path)
 
 if __name__ == "__main__":
     manager = TimestampManager()